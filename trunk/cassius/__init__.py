@@ -13,13 +13,14 @@ if True: #STARTDOCUMENTATION::
     from mathtools import mean, wmean, linearfit, rms, stdev, covariance, correlation, ubiquitous
     from mathtools import erf, erfc
     from mathtools import gaussian_likelihood, poisson_likelihood
+    from mathtools import Minimizer
     from mathtools import principleComponents
 
     from utilities import unicode_number
     from utilities import regular, tickmarks
     from utilities import calcrange, calcrange_quartile
     from utilities import binning
-    from utilities import timesec, fromtimestring, totimestring, timeticks
+    from utilities import timesec, fromtimestring, totimestring, TimeFormatter, timeformatter, timeticks, calendarticks
     from utilities import SECOND, MINUTE, HOUR, DAY, WEEK, MONTH, YEAR
 
     from color import RGB, HLS, HSV
@@ -33,7 +34,7 @@ if True: #STARTDOCUMENTATION::
     from containers import Scatter, TimeSeries
     from containers import ColorField
     from containers import Region, MoveTo, EdgeTo, ClosePolygon, RegionMap
-    from containers import Curve
+    from containers import Curve, fit_many
     from containers import Line, Grid
     from containers import Legend, Style
     from containers import histogram
@@ -1,15 +1,26 @@
 # Standard Python packages
 import math, cmath
 import re
+import ast
 import itertools
+import collections
 import numbers
 import random
 import glob
 import copy
+import os
+import zlib
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
 
 # Special dependencies
 import numpy, numpy.random # sudo apt-get install python-numpy
-# import minuit # no package
+try:
+    import minuit
+except ImportError:
+    minuit = None
 
 # # Augustus dependencies
 # try:
@@ -61,8 +72,8 @@ class Layout:
 
     Signatures::
 
-       Layout(nrows, ncols, plot1[, plot2[, ...]])
-       Layout(plot1[, plot2[, ...]], nrows=value, ncols=value)
+       Layout(nrows, ncols, plot1[, plot2[, ...]] [, sharex=value] [, sharey=value])
+       Layout(plot1[, plot2[, ...]], nrows=value, ncols=value [, sharex=value] [, sharey=value])
 
     Arguments:
        nrows (number): number of rows
@@ -72,9 +83,16 @@ class Layout:
        plots (list of `Frame` or other `Layout` objects): plots to
        draw, organized in normal reading order (left to right, columns
        before rows)
+
+       sharex (bool or "col"): if True, all plots have the same x
+       range (the union of their ranges); if "col", plots in the same
+       column have the same x range
+
+       sharey (bool or "row"): if True, all plots have the same y
+       range; if "row", plots in the same row have the same y range
        
     Public Members:
-       `nrows`, `ncols`, `plots`
+       `nrows`, `ncols`, `plots`, `sharex`, `sharey`
 
     Behavior:
        It is possible to create an empty Layout (no plots).
@@ -88,9 +106,20 @@ class Layout:
 
        Layouts can be nested: e.g. `Layout(1, 2, top, Layout(2, 1,
        bottomleft, bottomright))`.
+
+       Shared ranges are found before drawing, with one call to
+       `ranges()` per plot; explicit limits (e.g. `xmin`) are
+       included in the union.  Nested Layouts and Legends do not
+       take part.
        """
 
     def __init__(self, *args, **kwds):
+        self.sharex, self.sharey = kwds.pop("sharex", False), kwds.pop("sharey", False)
+        if self.sharex not in (False, True, "col"):
+            raise ContainerException, "sharex must be True, False, or \"col\""
+        if self.sharey not in (False, True, "row"):
+            raise ContainerException, "sharey must be True, False, or \"row\""
+
         if "nrows" in kwds and "ncols" in kwds:
             self.nrows, self.ncols = kwds["nrows"], kwds["ncols"]
             self.plots = list(args)
@@ -137,6 +166,9 @@ class Layout:
     def __repr__(self):
         return "<Layout %dx%d at 0x%x>" % (self.nrows, self.ncols, id(self))
 
+# every change to a Frame draws a new number, so that (id, version) identifies a state even after an object is garbage-collected
+_versions = itertools.count()
+
 # for representing a coordinate axis
 class Frame:
     """Abstract superclass for all plots with drawable coordinate frames.
@@ -149,12 +181,39 @@ class Frame:
 
     Public Members:
        All frame arguments that have been set.
+
+    Behavior:
+       Setting or deleting any public member, or changing the
+       contents in place through a method like `fill`, `setvalues`,
+       or `append`, gives the Frame a new `_version`, which backends
+       may use to cache renderings.  Call `touch()` after modifying
+       contents by hand (e.g. `frame.values[3] = 5.`).
     """
 
     _not_frameargs = []
 
     def __init__(self, **frameargs):
         self.__dict__.update(frameargs)
+        self.touch()
+
+    def __setattr__(self, name, value):
+        self.__dict__[name] = value
+        # private members are derived caches and do not change what is drawn
+        if name[0] != "_":
+            self.__dict__["_version"] = _versions.next()
+
+    def __delattr__(self, name):
+        if name not in self.__dict__:
+            raise AttributeError, "%s instance has no attribute '%s'" % (self.__class__.__name__, name)
+        del self.__dict__[name]
+        if name[0] != "_":
+            self.__dict__["_version"] = _versions.next()
+
+    def touch(self):
+        """Mark the contents as changed, after modifying them in place
+        by hand (e.g. `frame.values[3] = 5.`), so that cached results
+        and renderings are not reused."""
+        self.__dict__["_version"] = _versions.next()
 
     def __repr__(self):
         return "<Frame %s at 0x%x>" % (str(self._frameargs()), id(self))
@@ -232,6 +291,7 @@ class Overlay(Frame):
         self.plots.append(plot)
         if getattr(self, "frame", None) is not None and self.frame < 0:
             self.frame -= 1
+        self.touch()
 
     def prepend(self, plot):
         """Prepend a plot at the beginning of `plots` (drawn first), keeping the `frame` pointer up-to-date."""
@@ -239,6 +299,7 @@ class Overlay(Frame):
         self.plots.insert(0, plot)
         if getattr(self, "frame", None) is not None and self.frame >= 0:
             self.frame += 1
+        self.touch()
 
     def __repr__(self):
         if getattr(self, "frame", None) is not None:
@@ -335,34 +396,50 @@ class Stack(Frame):
            differ (ignoring small numerical errors).
         """
 
-        bins = None
+        bins, edges = None, None
         for hold in self.plots:
             if bins is None:
                 bins = hold.bins[:]
+                edges = self._edges(hold)
+                if edges is not None:
+                    tolerance = (mathtools.epsilon * abs(edges[:,1] - edges[:,0]))[:,numpy.newaxis]
             else:
                 same = (len(hold.bins) == len(bins))
                 if same:
-                    for oldbin, refbin in zip(hold.bins, bins):
-                        if HistogramAbstract._numeric(hold, oldbin) and HistogramAbstract._numeric(hold, refbin):
-                            xepsilon = mathtools.epsilon * abs(refbin[1] - refbin[0])
-                            if abs(oldbin[0] - refbin[0]) > xepsilon or abs(oldbin[1] - refbin[1]) > xepsilon:
-                                same = False
-                                break
-                        else:
-                            if oldbin != refbin:
-                                same = False
-                                break
+                    holdedges = self._edges(hold)
+                    if edges is not None and holdedges is not None:
+                        same = numpy.allclose(holdedges, edges, rtol=0., atol=tolerance)
+                    else:
+                        same = (hold.bins == bins)
 
                 if not same:
                     raise ContainerException, "Bins in stacked histograms must be the same"
         return bins
 
+    def _edges(self, hist):
+        """Bin edges of `hist` as an (N, 2) array, or `None` if they are not numeric."""
+
+        if isinstance(hist, HistogramCategorical):
+            return None
+        try:
+            edges = numpy.array(hist.bins, dtype=numpy.float)
+        except (ValueError, TypeError):
+            return None
+        if edges.shape != (len(hist.bins), 2):
+            return None
+        return edges
+
     def stack(self):
         """Returns a list of new histograms, obtained by stacking the inputs.
 
         Exceptions:
            Raises `ContainerException` if any of the histogram bins
            differ (ignoring small numerical errors).
+
+        Considerations:
+           The bin check and the sums are cached until the Stack or
+           any of its histograms changes; the histograms returned are
+           new on every call.
         """
 
         if len(self.plots) == 0:
@@ -373,8 +450,19 @@ class Stack(Frame):
                 if len(getattr(self, styles)) != len(self.plots):
                     raise ContainerException, "There must be as many %s as plots" % styles
 
-        bins = self.bins()
-        gap = max([i.gap for i in self.plots])
+        key = (self._version, tuple([(id(hold), hold._version) for hold in self.plots]))
+        cached = getattr(self, "_stackcache", None)
+        if cached is not None and cached[0] == key:
+            key, bins, gap, stacked = cached
+            bins = bins[:]
+        else:
+            bins = self.bins()
+            gap = max([i.gap for i in self.plots])
+
+            # row i is the sum of the first i+1 histograms
+            stacked = numpy.cumsum(numpy.array([hold.values for hold in self.plots], dtype=numpy.float), axis=0)
+            self._stackcache = (key, bins, gap, stacked)
+
         output = []
         for i in xrange(len(self.plots)):
             if getattr(self, "linewidths", None) is not None:
@@ -402,11 +490,9 @@ class Stack(Frame):
             else:
                 hnew = HistogramAbstract(bins, 0, linewidth, linestyle, linecolor, fillcolor, gap)
 
-            for j in xrange(i+1):
-                for bin in xrange(len(hnew.values)):
-                    hnew.values[bin] += self.plots[j].values[bin]
-
+            hnew.values = stacked[i].tolist()
             output.append(hnew)
+
         return output
 
     def overlay(self):
@@ -1187,6 +1273,9 @@ class Histogram(HistogramAbstract):
         elif isinstance(weights, (numbers.Number, numpy.number)):
             weights = [weights]
 
+        # the counters are updated directly, without a new version for every value
+        fields = self.__dict__
+        self.touch()
         for counter, (value, weight) in enumerate(itertools.izip(values, weights)):
             if limit is not None and counter >= limit: break
 
@@ -1201,13 +1290,13 @@ class Histogram(HistogramAbstract):
 
             index = int(math.floor((value - self._low)*self._factor))
             if index < 0:
-                self.underflow += weight
+                fields["underflow"] += weight
             elif index >= len(self.bins):
-                self.overflow += weight
+                fields["overflow"] += weight
             else:
                 self.values[index] += weight
                 self._sumx[index] += weight * value
-            self.entries += 1
+            fields["entries"] += 1
 
     def index(self, value):
         """Transform a value into the corresponding bin index."""
@@ -1391,14 +1480,36 @@ class TimeHist(Histogram):
            of the tick-marks (use `t0` if `None`)
 
         Behavior:
-           A "month" is taken to be exactly 31 days and a "year" is
-           taken to be exactly 365 days.  Week markers will only line
-           up with month markers at `start`.
+           If `start` is `None` and an interval is a whole number of
+           MONTHs or YEARs, its ticks are placed on the first day of
+           real calendar months or years (UTC).
+
+           Otherwise, a "month" is taken to be exactly 31 days and a
+           "year" is taken to be exactly 365 days.  Week markers will
+           only line up with month markers at `start`.
         """
 
         if isinstance(start, basestring): start = fromtimestring(start)
         return utilities.timeticks(major, minor, self.outformat, self._subseconds, self._t0, start)
 
+    def calendarticks(self, N=6, format=None):
+        """Set x tick-marks on calendar boundaries, choosing the
+        granularity (seconds to years) from the range being drawn.
+
+        Arguments:
+           N (int): maximum number of major ticks (ticks with labels)
+
+           format (string or `None`): time format for the labels; if
+           `None`, use this object's `outformat`
+
+        Behavior:
+           See `utilities.calendarticks`; these are the default
+           tick-marks when `xticks` is `Auto`.
+        """
+
+        if format is None: format = self.outformat
+        return utilities.calendarticks(N, format, self._subseconds, self._t0)
+
 class HistogramNonUniform(HistogramAbstract):
     """Represent a 1-D histogram with uniform bins.
 
@@ -1544,6 +1655,9 @@ class HistogramNonUniform(HistogramAbstract):
         elif isinstance(weights, (numbers.Number, numpy.number)):
             weights = [weights]
 
+        # the counters are updated directly, without a new version for every value
+        fields = self.__dict__
+        self.touch()
         for counter, (value, weight) in enumerate(itertools.izip(values, weights)):
             if limit is not None and counter >= limit: break
 
@@ -1569,11 +1683,11 @@ class HistogramNonUniform(HistogramAbstract):
                 elif not (value >= high): greater_than_all = False
 
             if not filled: 
-                if less_than_all: self.underflow += weight
-                elif greater_than_all: self.overflow += weight
-                else: self.inflow += weight
+                if less_than_all: fields["underflow"] += weight
+                elif greater_than_all: fields["overflow"] += weight
+                else: fields["inflow"] += weight
 
-            self.entries += 1
+            fields["entries"] += 1
 
     def index(self, value):
         """Transform a value into the corresponding bin index."""
@@ -1738,6 +1852,9 @@ class HistogramCategorical(HistogramAbstract):
         elif isinstance(weights, (numbers.Number, numpy.number)):
             weights = [weights]
 
+        # the counters are updated directly, without a new version for every value
+        fields = self.__dict__
+        self.touch()
         for counter, (value, weight) in enumerate(itertools.izip(values, weights)):
             if limit is not None and counter >= limit: break
 
@@ -1747,8 +1864,8 @@ class HistogramCategorical(HistogramAbstract):
                 self._sumx[value] += weight * value
             except KeyError:
                 value = -1
-                self.inflow += weight
-            self.entries += 1
+                fields["inflow"] += weight
+            fields["entries"] += 1
 
             if fillstore:
                 if self._lenstore is None:
@@ -1829,17 +1946,49 @@ class Scatter(Frame):
        linecolor (string, color, or `None`): color of a line
        connecting all points; no line if `None`
 
+       xcategories, ycategories (dict or `None`): for string-valued x
+       or y, a dict of category labels to axis positions; pass the
+       same dict to several Scatters to line up their axes
+
+       dtype (numpy dtype): storage type of `values`; `numpy.float32`
+       halves the memory of large scatter plots
+
+       columnar (bool): if True, store `values` column-by-column
+       (Fortran order), so that each signature field is a contiguous
+       array
+
+       density (`None`, "hex", or "square"): shape of the bins used to
+       draw a density map instead of markers when there are too many
+       points; `None` to always draw markers
+
+       densitybins (int): number of density bins across the x axis
+
+       densitythreshold (int): draw a density map only if more than
+       this many points are visible
+
+       densitygradient (function): maps bin counts to colors, like
+       `ColorField.tocolor`
+
        `**frameargs`: keyword arguments for the coordinate frame
 
     Public members:
        `values`, `sig`, `limit`, `calcrange`, `connector`, `marker`,
        `markersize`, `markercolor`, `markeroutline`, `lines`,
-       `linewidth`, `linestyle`, `linecolor`, and frame arguments.
+       `linewidth`, `linestyle`, `linecolor`, `dtype`, `columnar`,
+       `density`, `densitybins`, `densitythreshold`,
+       `densitygradient`, and frame arguments.
 
     Behavior:
        Points are stored internally as an N-dimensional numpy array of
        `values`, with meanings specified by `sig`.
 
+       With `columnar` storage, `x()`, `y()`, etc. return contiguous
+       views of `values` (no copying) and the range-finding and
+       masking in the backend run over contiguous memory.  Row-wise
+       operations, such as `append`, are slower.  Note that
+       `numpy.float32` has only about 7 significant digits, which is
+       not enough for time values in seconds since 1970.
+
        Input points are _copied_, not set by reference, with both
        input methods.  The set-by-signature method is likely to be
        faster for large datasets.
@@ -1863,18 +2012,32 @@ class Scatter(Frame):
        Setting `linecolor = None` is the only proper way to direct the
        graphics backend to not draw a line connecting all visible points
 
+       When more than `densitythreshold` points (after `limit`) are
+       visible, the markers and error bars are replaced by a raster of
+       point counts in hexagonal or square bins, which keeps the size
+       of the output independent of the number of points.  Empty bins
+       are transparent.  The `connector` line is drawn as usual, and
+       no density map is drawn if `marker` is `None`.
+
+       String-valued x or y are mapped to positions 1, 2, 3, ... in
+       sorted order, and the labels are used as tick-marks.  A
+       `categories` dict that is shared among Scatters is extended
+       with any new labels, so all of them use the same positions.
+
     Exceptions:
        At least `x` and `y` are required.
     """
 
-    _not_frameargs = ["sig", "values", "limit", "calcrange", "connector", "marker", "markersize", "markercolor", "markeroutline", "linewidth", "linestyle", "linecolor"]
+    _not_frameargs = ["sig", "values", "limit", "calcrange", "connector", "marker", "markersize", "markercolor", "markeroutline", "linewidth", "linestyle", "linecolor", "dtype", "columnar", "density", "densitybins", "densitythreshold", "densitygradient"]
 
-    def __init__(self, values=[], sig=None, x=None, y=None, ex=None, ey=None, exl=None, eyl=None, limit=None, calcrange=utilities.calcrange, connector=None, marker="circle", markersize=1., markercolor="black", markeroutline=None, linewidth=1., linestyle="solid", linecolor="black", **frameargs):
+    def __init__(self, values=[], sig=None, x=None, y=None, ex=None, ey=None, exl=None, eyl=None, limit=None, calcrange=utilities.calcrange, connector=None, marker="circle", markersize=1., markercolor="black", markeroutline=None, linewidth=1., linestyle="solid", linecolor="black", xcategories=None, ycategories=None, dtype=numpy.float, columnar=False, density="hex", densitybins=100, densitythreshold=100000, densitygradient=color.gradients["rainbow"], **frameargs):
         self.limit, self.calcrange = limit, calcrange
         self.connector, self.marker, self.markersize, self.markercolor, self.markeroutline, self.linewidth, self.linestyle, self.linecolor = connector, marker, markersize, markercolor, markeroutline, linewidth, linestyle, linecolor
+        self.dtype, self.columnar = dtype, columnar
+        self.density, self.densitybins, self.densitythreshold, self.densitygradient = density, densitybins, densitythreshold, densitygradient
 
         if sig is None:
-            self.setvalues(x, y, ex, ey, exl, eyl)
+            self.setvalues(x, y, ex, ey, exl, eyl, xcategories, ycategories)
         else:
             self.setbysig(values, sig)
 
@@ -1896,11 +2059,22 @@ class Scatter(Frame):
         returns the first thousand x error bars.
         """
 
-        return dict(zip(self.sig, range(len(self.sig))))
+        sig = tuple(self.sig)
+        if getattr(self, "_indexsig", None) != sig:
+            self._index = dict(zip(sig, range(len(sig))))
+            self._indexsig = sig
+        return dict(self._index)
+
+    def _store(self, values, copy=True):
+        if getattr(self, "columnar", False): order = "F"
+        else: order = "C"
+        return numpy.array(values, dtype=getattr(self, "dtype", numpy.float), order=order, copy=copy)
 
     def sort(self, key="x"):
         """Sorts the data in values by one of the fields (does not affect graphical output)."""
-        self.values = self.values[self.values[:,self.index()[key]].argsort(),]
+        self.values = self._store(self.values[self.values[:,self.index()[key]].argsort(),], copy=False)
+        self._rangescache = {}
+        self.touch()
 
     def _prepare(self, xmin=None, ymin=None, xmax=None, ymax=None, xlog=None, ylog=None):
         if len(self.values) == 0:
@@ -1946,18 +2120,18 @@ class Scatter(Frame):
 
         if self.connector == "xsort":
             mask = limitx(mask)
-            self._xlimited_values = (self.values[mask])[:,(index["x"],index["y"])]
+            self._xlimited_values = numpy.column_stack((x[mask], y[mask]))
             self._ylimited_values = numpy.array([], dtype=numpy.float)
             mask = limity(mask)
 
         elif self.connector == "ysort":
             mask = limity(mask)
             self._xlimited_values = numpy.array([], dtype=numpy.float)
-            self._ylimited_values = (self.values[mask])[:,(index["x"],index["y"])]
+            self._ylimited_values = numpy.column_stack((x[mask], y[mask]))
             mask = limitx(mask)
 
         elif self.connector == "unsorted":
-            self._xlimited_values = self.values[:,(index["x"],index["y"])]
+            self._xlimited_values = numpy.column_stack((x, y))
             self._ylimited_values = numpy.array([], dtype=numpy.float)
             mask = limitx(mask)
             mask = limity(mask)
@@ -1989,6 +2163,68 @@ class Scatter(Frame):
         if self.connector == "ysort" and len(self._ylimited_values) > 0:
             self._ylimited_values = self._ylimited_values[numpy.argsort(self._ylimited_values[:,1])]
 
+    def _densityfield(self, xmin, ymin, xmax, ymax, xlog, ylog, width, height):
+        # must be called after _prepare(); width and height are the window size in drawing units
+        x, y = self.x(limited=True), self.y(limited=True)
+
+        mask = numpy.logical_and(x >= xmin, x <= xmax)
+        numpy.logical_and(mask, (y >= ymin), mask)
+        numpy.logical_and(mask, (y <= ymax), mask)
+        x, y = x[mask], y[mask]
+
+        if xlog: x, xlow, xhigh = numpy.log10(x), math.log10(xmin), math.log10(xmax)
+        else: xlow, xhigh = xmin, xmax
+        if ylog: y, ylow, yhigh = numpy.log10(y), math.log10(ymin), math.log10(ymax)
+        else: ylow, yhigh = ymin, ymax
+
+        # positions in drawing units (y increasing upward)
+        px = (x - xlow)*(width/(xhigh - xlow))
+        py = (y - ylow)*(height/(yhigh - ylow))
+
+        xbins = int(self.densitybins)
+        if self.density == "square":
+            ybins = max(1, int(round(xbins * height/width)))
+            values = numpy.histogram2d(px, py, bins=(xbins, ybins), range=((0., width), (0., height)))[0]
+
+        elif self.density == "hex":
+            # two offset rectangular lattices; each point belongs to the nearest center
+            hexwidth = width/xbins
+            hexheight = hexwidth*math.sqrt(3.)
+            ncols = 2*int(math.ceil(width/hexwidth)) + 4
+            nrows = 2*int(math.ceil(height/hexheight)) + 4
+
+            def cells(sx, sy):
+                ix1, iy1 = numpy.floor(sx + 0.5), numpy.floor(sy + 0.5)
+                ix2, iy2 = numpy.floor(sx), numpy.floor(sy)
+                first = ((sx - ix1)**2 + 3.*(sy - iy1)**2) < ((sx - ix2 - 0.5)**2 + 3.*(sy - iy2 - 0.5)**2)
+                i = numpy.where(first, 2.*ix1, 2.*ix2 + 1.).astype(numpy.int64)
+                j = numpy.where(first, 2.*iy1, 2.*iy2 + 1.).astype(numpy.int64)
+                return (i + 2)*nrows + (j + 2)
+
+            counts = numpy.bincount(cells(px/hexwidth, py/hexheight), minlength=ncols*nrows)
+
+            # rasterize the hexagons with a few pixels per bin
+            xbins *= 4
+            ybins = max(1, int(round(xbins * height/width)))
+            sx = (numpy.arange(xbins) + 0.5)*(width/xbins)/hexwidth
+            sy = (numpy.arange(ybins) + 0.5)*(height/ybins)/hexheight
+            sx, sy = numpy.meshgrid(sx, sy, indexing="ij")
+            values = counts[cells(sx, sy)].astype(numpy.float)
+
+        else:
+            raise ContainerException, "Scatter.density must be None, \"hex\", or \"square\"."
+
+        gradient = self.densitygradient
+        def tocolor(value, low, high):
+            if value <= 0.: return (0, 0, 0, 0)
+            return gradient(value, low, high)
+
+        zmax = values.max()
+        if zmax <= 0.: zmax = 1.
+        output = ColorField(xbins, xmin, xmax, ybins, ymin, ymax, zmin=0., zmax=zmax, tocolor=tocolor)
+        output.values = values
+        return output
+
     def setbysig(self, values, sig=("x", "y")):
         """Sets the values using a signature.
 
@@ -2007,9 +2243,11 @@ class Scatter(Frame):
         if "x" not in sig or "y" not in sig:
             raise ContainerException, "Signature must contain \"x\" and \"y\""
         self.sig = sig
-        self.values = numpy.array(values, dtype=numpy.float)
+        self.values = self._store(values)
+        self._rangescache = {}
+        self.touch()
 
-    def setvalues(self, x=None, y=None, ex=None, ey=None, exl=None, eyl=None):
+    def setvalues(self, x=None, y=None, ex=None, ey=None, exl=None, eyl=None, xcategories=None, ycategories=None):
         """Sets the values with separate lists.
 
         Arguments:
@@ -2026,6 +2264,10 @@ class Scatter(Frame):
 
            eyl (list of floats or `None`): asymmetric lower errors in y
 
+           xcategories, ycategories (dict or `None`): if x or y are
+           strings, a dict of category labels to axis positions to
+           use and extend (see `utilities.categorize`)
+
         Exceptions:
            At least `x` and `y` are required.
         """
@@ -2054,8 +2296,9 @@ class Scatter(Frame):
             longdim = max(longdim, len(eyl))
             shortdim += 1
 
+        self._rangescache = {}
         self.sig = []
-        self.values = numpy.empty((longdim, shortdim), dtype=numpy.float)
+        self.values = numpy.empty((longdim, shortdim), dtype=self.dtype, order=("F" if self.columnar else "C"))
 
         if x is not None:
             x = numpy.array(x)
@@ -2063,10 +2306,7 @@ class Scatter(Frame):
                 x = numpy.array(x, dtype=numpy.string_)
             if x.dtype.char in numpy.typecodes["Character"] + "Sa":
                 if len(x) > 0:
-                    unique = numpy.unique(x)
-                    self._xticks = dict(map(lambda (i, val): (float(i+1), val), enumerate(unique)))
-                    strtoval = dict(map(lambda (i, val): (val, float(i+1)), enumerate(unique)))
-                    x = numpy.apply_along_axis(numpy.vectorize(lambda s: strtoval[s]), 0, x)
+                    x, self._xcategories = utilities.categorize(x, xcategories)
                 else:
                     x = numpy.array([], dtype=numpy.float)
 
@@ -2079,10 +2319,7 @@ class Scatter(Frame):
                 y = numpy.array(y, dtype=numpy.string_)
             if y.dtype.char in numpy.typecodes["Character"] + "Sa":
                 if len(y) > 0:
-                    unique = numpy.unique(y)
-                    self._yticks = dict(map(lambda (i, val): (float(i+1), val), enumerate(unique)))
-                    strtoval = dict(map(lambda (i, val): (val, float(i+1)), enumerate(unique)))
-                    y = numpy.apply_along_axis(numpy.vectorize(lambda s: strtoval[s]), 0, y)
+                    y, self._ycategories = utilities.categorize(y, ycategories)
                 else:
                     y = numpy.array([], dtype=numpy.float)
 
@@ -2144,8 +2381,13 @@ class Scatter(Frame):
         if exl is not None: newvalues[index["exl"]] = exl
         if eyl is not None: newvalues[index["eyl"]] = eyl
 
-        self.values.resize((oldlen+1, oldwidth), refcheck=False)
-        self.values[oldlen,:] = newvalues
+        if not getattr(self, "columnar", False):
+            self.values.resize((oldlen+1, oldwidth), refcheck=False)
+            self.values[oldlen,:] = newvalues
+        else:
+            self.values = self._store(numpy.vstack((self.values, [newvalues])), copy=False)
+        self._rangescache = {}
+        self.touch()
 
     def _strip(self, which, limited=False):
         try:
@@ -2217,10 +2459,45 @@ class Scatter(Frame):
            and zero-valued contents are ignored)
 
            ylog (bool): requesting a logarithmic y axis
+
+        Behavior:
+           The bounding box includes the extent of any error bars.
+
+           The result is cached until the Scatter's `values` change,
+           whether they are replaced, changed by a method like
+           `setvalues` or `append`, or modified in place (e.g.
+           `scatter.values[:,1] *= 100.`), which is detected with a
+           checksum of the array.
         """
 
-        x = self.x()
-        y = self.y()
+        # the checksum is cheaper than the ranges and catches changes that the version does not
+        state = (self._version, id(self.values), self.values.shape, self.values.dtype.str, zlib.crc32(numpy.ascontiguousarray(self.values)))
+        if getattr(self, "_rangesstate", None) != state:
+            self._rangescache = {}
+            self._rangesstate = state
+
+        key = (xlog, ylog, self.calcrange)
+        if key not in self._rangescache:
+            self._rangescache[key] = self._ranges(xlog, ylog)
+        return self._rangescache[key]
+
+    def _ranges(self, xlog, ylog):
+        index = self.index()
+        x = self.values[:,index["x"]]
+        y = self.values[:,index["y"]]
+
+        # error bars extend the range on either side of each point
+        xlow, xhigh, ylow, yhigh = x, x, y, y
+        if "ex" in index:
+            ex = numpy.absolute(self.values[:,index["ex"]])
+            xlow, xhigh = x - ex, x + ex
+        if "exl" in index:
+            xlow = x - numpy.absolute(self.values[:,index["exl"]])
+        if "ey" in index:
+            ey = numpy.absolute(self.values[:,index["ey"]])
+            ylow, yhigh = y - ey, y + ey
+        if "eyl" in index:
+            ylow = y - numpy.absolute(self.values[:,index["eyl"]])
 
         # if we're plotting logarithmically, only the positive values are relevant for ranges
         if xlog or ylog:
@@ -2229,10 +2506,9 @@ class Scatter(Frame):
                 numpy.logical_and(mask, (x > 0.), mask)
             if ylog:
                 numpy.logical_and(mask, (y > 0.), mask)
-            x = x[mask]
-            y = y[mask]
+            xlow, xhigh, ylow, yhigh = xlow[mask], xhigh[mask], ylow[mask], yhigh[mask]
 
-        if len(x) < 2:
+        if len(xlow) < 2:
             if xlog:
                 xmin, xmax = 0.1, 1.
             else:
@@ -2243,8 +2519,14 @@ class Scatter(Frame):
                 ymin, ymax = 0., 1.
 
         elif callable(self.calcrange):
-            xmin, xmax = self.calcrange(x, xlog)
-            ymin, ymax = self.calcrange(y, ylog)
+            if xlow is xhigh:
+                xmin, xmax = self.calcrange(xlow, xlog)
+            else:
+                xmin, xmax = self.calcrange(xlow, xlog)[0], self.calcrange(xhigh, xlog)[1]
+            if ylow is yhigh:
+                ymin, ymax = self.calcrange(ylow, ylog)
+            else:
+                ymin, ymax = self.calcrange(ylow, ylog)[0], self.calcrange(yhigh, ylog)[1]
 
         else:
             raise ContainerException, "Scatter.calcrange must be a function."
@@ -2446,14 +2728,36 @@ class TimeSeries(Scatter):
            of the tick-marks (use `t0` if `None`)
 
         Behavior:
-           A "month" is taken to be exactly 31 days and a "year" is
-           taken to be exactly 365 days.  Week markers will only line
-           up with month markers at `start`.
+           If `start` is `None` and an interval is a whole number of
+           MONTHs or YEARs, its ticks are placed on the first day of
+           real calendar months or years (UTC).
+
+           Otherwise, a "month" is taken to be exactly 31 days and a
+           "year" is taken to be exactly 365 days.  Week markers will
+           only line up with month markers at `start`.
         """
 
         if isinstance(start, basestring): start = fromtimestring(start)
         return utilities.timeticks(major, minor, self.outformat, self._subseconds, self._t0, start)
 
+    def calendarticks(self, N=6, format=None):
+        """Set x tick-marks on calendar boundaries, choosing the
+        granularity (seconds to years) from the range being drawn.
+
+        Arguments:
+           N (int): maximum number of major ticks (ticks with labels)
+
+           format (string or `None`): time format for the labels; if
+           `None`, use this object's `outformat`
+
+        Behavior:
+           See `utilities.calendarticks`; these are the default
+           tick-marks when `xticks` is `Auto`.
+        """
+
+        if format is None: format = self.outformat
+        return utilities.calendarticks(N, format, self._subseconds, self._t0)
+
 ######################################################### Colorfield
 
 class ColorField(Frame):
@@ -2512,31 +2816,20 @@ class ColorField(Frame):
         for i in xrange(self.xbins()):
             for j in xrange(ybins):
                 self.values[i,j] = func(*self.center(i, j))
+        self.touch()
 
     def remap(self, func):
         ybins = self.ybins()
         for i in xrange(self.xbins()):
             for j in xrange(ybins):
                 self.values[i,j] = func(*self.center(i, j), old=self.values[i,j])
+        self.touch()
 
     def zranges(self):
-        ybins = self.ybins()
-        components = self.components()
-        if components == 1:
-            zmin, zmax = None, None
+        if self.components() == 1:
+            return self.values.min(), self.values.max()
         else:
-            zmin, zmax = [None]*self.components(), [None]*self.components()
-
-        for i in xrange(self.xbins()):
-            for j in xrange(ybins):
-                if components == 1:
-                    if zmin is None or self.values[i,j] < zmin: zmin = self.values[i,j]
-                    if zmax is None or self.values[i,j] > zmax: zmax = self.values[i,j]
-                else:
-                    for k in xrange(components):
-                        if zmin[k] is None or self.values[i,j,k] < zmin[k]: zmin[k] = self.values[i,j,k]
-                        if zmax[k] is None or self.values[i,j,k] > zmax[k]: zmax[k] = self.values[i,j,k]
-        return zmin, zmax
+            return list(self.values.min(axis=0).min(axis=0)), list(self.values.max(axis=0).max(axis=0))
 
     def ranges(self, xlog=False, ylog=False):
         """Return a data-space bounding box as `xmin, ymin, xmax, ymax`.
@@ -2787,6 +3080,256 @@ class RegionMap(Frame):
 
 ######################################################### Curves and functions
 
+# numpy functions with different names from their counterparts in math and cmath
+_numpy_equivalents = {"asin": "arcsin", "acos": "arccos", "atan": "arctan", "atan2": "arctan2", "asinh": "arcsinh", "acosh": "arccosh", "atanh": "arctanh", "pow": "power"}
+
+# compiled Curve functions: (func, var, parameter names, form, vectorize, namespace contents) -> _CurveFunction
+_curvefunctions = collections.OrderedDict()
+_curvefunctions_size = 256
+
+def _referenced_names(func):
+    """Global names that a string-based Curve function refers to."""
+
+    names = set()
+    codes = [compile("(%s)" % func, "<Curve>", "eval")]
+    while len(codes) > 0:
+        code = codes.pop()
+        names.update(code.co_names)
+        codes.extend([const for const in code.co_consts if isinstance(const, type(code))])
+    return tuple(sorted(names))
+
+def _namespace_key(namespace, names):
+    """Hashable summary of the values that `names` have in a Curve
+    namespace, so that a compiled function is not reused after one of
+    them is added or rebound (the compiled function holds the values,
+    so their ids stay unique)."""
+
+    if namespace is None:
+        return None
+    if not isinstance(namespace, dict):
+        namespace = namespace.__dict__
+    return tuple([(name, id(namespace[name])) for name in names if name in namespace])
+
+def _curve_namespace(form, namespace, vectorized):
+    """Names available to a string-based Curve function, with numpy
+    functions in place of math (or cmath) functions if `vectorized`."""
+
+    if form is Curve.COMPLEX: g = dict(cmath.__dict__)
+    else: g = dict(math.__dict__)
+
+    if vectorized:
+        for name in g.keys():
+            if name[0] != "_":
+                equivalent = getattr(numpy, _numpy_equivalents.get(name, name), None)
+                if equivalent is not None:
+                    g[name] = equivalent
+
+    # missing these important functions (mathtools versions work on arrays, too)
+    g["erf"] = mathtools.erf
+    g["erfc"] = mathtools.erfc
+
+    if namespace is not None:
+        if isinstance(namespace, dict):
+            g.update(namespace)
+        else:
+            g.update(namespace.__dict__)
+    return g
+
+# default methods for Curve.objective; these work on numpy arrays as well as numbers
+
+def _chi2(f, x, y):
+    return (f - y)**2
+
+def _chi2_relative(f, x, y):
+    return (f - y)**2/abs(y)
+
+def _chi2_errors(f, x, y, ey):
+    return (f - y)**2/ey**2
+
+def _chi2_asymmetric(f, x, y, ey, eyl):
+    if isinstance(f, numpy.ndarray):
+        return (f - y)**2/numpy.where(f < y, eyl, ey)**2
+    return ((f - y)**2/eyl**2 if f < y else (f - y)**2/ey**2)
+
+# default exclusions for Curve.objective; these work on numpy arrays as well as numbers
+
+def _exclude_nothing(*args):
+    return False
+
+def _exclude_zero_y(x, y):
+    return y == 0.
+
+def _exclude_zero_ey(x, y, ey):
+    return ey == 0.
+
+def _exclude_zero_errors(x, y, ey, eyl):
+    return (eyl == 0.) | (ey == 0.)
+
+_vectorized_exclusions = set([_exclude_nothing, _exclude_zero_y, _exclude_zero_ey, _exclude_zero_errors])
+
+def _included(exclude, values):
+    """Boolean array of the rows of `values` (x, y[, ey[, eyl]]) that `exclude` does not exclude."""
+
+    try:
+        vectorized = (exclude in _vectorized_exclusions)
+    except TypeError:
+        vectorized = False
+
+    if vectorized:
+        excluded = numpy.empty(len(values), dtype=numpy.bool)
+        excluded[:] = exclude(*values.T)
+        return ~excluded
+    return numpy.array([not exclude(*row) for row in values], dtype=numpy.bool)
+
+# objective methods that can be applied to all data points at once
+_vectorized_methods = set([_chi2, _chi2_relative, _chi2_errors, _chi2_asymmetric, mathtools.gaussian_likelihood, mathtools.poisson_likelihood])
+
+# derivatives of those methods with respect to f (on arrays)
+_method_derivatives = {
+    _chi2: lambda f, x, y: 2.*(f - y),
+    _chi2_relative: lambda f, x, y: 2.*(f - y)/abs(y),
+    _chi2_errors: lambda f, x, y, ey: 2.*(f - y)/ey**2,
+    _chi2_asymmetric: lambda f, x, y, ey, eyl: 2.*(f - y)/numpy.where(f < y, eyl, ey)**2,
+    mathtools.gaussian_likelihood: lambda f, x, y, ey: numpy.where(ey != 0., 2.*(f - y)/numpy.where(ey != 0., ey, 1.)**2, 0.),
+    mathtools.poisson_likelihood: lambda f, x, y: numpy.where(f > 0., -2.*(y/numpy.where(f > 0., f, 1.) - 1.), 0.),
+    }
+
+# least-squares methods: method -> w, such that method(f, x, y, ...) == ((f - y)*w)**2 (on arrays)
+_method_weights = {
+    _chi2: lambda f, x, y: numpy.ones(len(f)),
+    _chi2_relative: lambda f, x, y: 1./numpy.sqrt(abs(y)),
+    _chi2_errors: lambda f, x, y, ey: 1./ey,
+    _chi2_asymmetric: lambda f, x, y, ey, eyl: 1./numpy.where(f < y, eyl, ey),
+    mathtools.gaussian_likelihood: lambda f, x, y, ey: numpy.where(ey != 0., 1./numpy.where(ey != 0., ey, 1.), 0.),
+    }
+
+# derivatives of one-argument functions, in terms of their argument
+_derivative_rules = {"exp": "exp(%s)", "log": "1./%s", "log10": "1./(%s*log(10.))", "sqrt": "0.5/sqrt(%s)",
+                     "sin": "cos(%s)", "cos": "(-sin(%s))", "tan": "1./cos(%s)**2",
+                     "sinh": "cosh(%s)", "cosh": "sinh(%s)", "tanh": "1./cosh(%s)**2",
+                     "asin": "1./sqrt(1. - %s**2)", "acos": "(-1./sqrt(1. - %s**2))", "atan": "1./(1. + %s**2)",
+                     "erf": "2./sqrt(pi)*exp(-%s**2)", "erfc": "(-2./sqrt(pi)*exp(-%s**2))"}
+_derivative_names = set(_derivative_rules.keys() + ["pi"])
+
+# derivatives of string-based Curve functions: (func, var, parameter name) -> expression string, or None if not differentiable
+_curvederivatives = collections.OrderedDict()
+
+class _NotDifferentiable(Exception): pass
+
+def _source(node):
+    """Python source for an expression tree of arithmetic and function calls."""
+
+    if isinstance(node, ast.Num):
+        return repr(node.n)
+    elif isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.BinOp):
+        op = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.Pow: "**"}.get(node.op.__class__)
+        if op is None: raise _NotDifferentiable
+        return "(%s %s %s)" % (_source(node.left), op, _source(node.right))
+    elif isinstance(node, ast.UnaryOp):
+        op = {ast.USub: "-", ast.UAdd: "+"}.get(node.op.__class__)
+        if op is None: raise _NotDifferentiable
+        return "(%s%s)" % (op, _source(node.operand))
+    elif isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.keywords or node.starargs or node.kwargs: raise _NotDifferentiable
+        return "%s(%s)" % (node.func.id, ", ".join(map(_source, node.args)))
+    else:
+        raise _NotDifferentiable
+
+def _differentiate(node, name):
+    """Python source for the derivative of an expression tree with
+    respect to `name`, or None if it is identically zero; raises
+    _NotDifferentiable for anything but arithmetic and the functions
+    in _derivative_rules."""
+
+    if isinstance(node, ast.Num):
+        return None
+    elif isinstance(node, ast.Name):
+        return ("1." if node.id == name else None)
+
+    elif isinstance(node, ast.UnaryOp):
+        d = _differentiate(node.operand, name)
+        if d is None or isinstance(node.op, ast.UAdd): return d
+        elif isinstance(node.op, ast.USub): return "(-%s)" % d
+        raise _NotDifferentiable
+
+    elif isinstance(node, ast.BinOp):
+        a, b = _source(node.left), _source(node.right)
+        da, db = _differentiate(node.left, name), _differentiate(node.right, name)
+        if da is None and db is None: return None
+
+        if isinstance(node.op, ast.Add):
+            terms = [x for x in (da, db) if x is not None]
+        elif isinstance(node.op, ast.Sub):
+            terms = [x for x in (da, None if db is None else "(-%s)" % db) if x is not None]
+        elif isinstance(node.op, ast.Mult):
+            terms = [x for x in (None if da is None else "%s*%s" % (da, b), None if db is None else "%s*%s" % (a, db)) if x is not None]
+        elif isinstance(node.op, ast.Div):
+            terms = [x for x in (None if da is None else "%s/%s" % (da, b), None if db is None else "(-%s*%s/%s**2)" % (a, db, b)) if x is not None]
+        elif isinstance(node.op, ast.Pow):
+            if db is None:
+                terms = ["%s*%s**(%s - 1)*%s" % (b, a, b, da)]
+            else:
+                terms = ["%s**%s*(%s*log(%s)%s)" % (a, b, db, a, "" if da is None else " + %s*%s/%s" % (b, da, a))]
+        else:
+            raise _NotDifferentiable
+        return "(%s)" % " + ".join(terms)
+
+    elif isinstance(node, ast.Call):
+        source = _source(node)
+        derivatives = [_differentiate(arg, name) for arg in node.args]
+        if derivatives.count(None) == len(derivatives): return None
+        if len(node.args) != 1 or node.func.id not in _derivative_rules: raise _NotDifferentiable
+        return "(%s*%s)" % (_derivative_rules[node.func.id] % _source(node.args[0]), derivatives[0])
+
+    else:
+        raise _NotDifferentiable
+
+def _curve_derivative(func, var, name):
+    """Expression string for the derivative of string function `func` with respect to `name`, or None."""
+
+    key = (func, var, name)
+    if key in _curvederivatives:
+        return _curvederivatives[key]
+
+    try:
+        tree = ast.parse(func.strip(), mode="eval").body
+        output = _differentiate(tree, name)
+        if output is None: output = "0."
+    except (SyntaxError, _NotDifferentiable):
+        output = None
+
+    _curvederivatives[key] = output
+    if len(_curvederivatives) > _curvefunctions_size:
+        _curvederivatives.popitem(last=False)
+    return output
+
+class _CurveFunction:
+    """A Curve's function, compiled once for a given set of parameter
+    names: `scalar` takes one input value and `vector` takes a numpy
+    array of them, each followed by the parameter values in the order
+    of `parnames`.  `vectorizable` becomes False if `vector` turns out
+    not to work on arrays; callables are only vectorizable if they are
+    numpy ufuncs or `vectorize` is True."""
+
+    def __init__(self, func, var, parnames, form, namespace, vectorize):
+        self.func, self.parnames = func, parnames
+
+        if callable(func):
+            self.vectorizable = (vectorize or isinstance(func, numpy.ufunc))
+            self.scalar = self.vector = lambda t, *args: func(t, **dict(zip(parnames, args)))
+            try:
+                self.func_name = func.func_name
+            except AttributeError:
+                self.func_name = "built-in"
+        else:
+            self.vectorizable = True
+            code = "lambda %s: (%s)" % (", ".join(["(%s)" % var] + list(parnames)), func)
+            self.scalar = eval(code, _curve_namespace(form, namespace, False))
+            self.vector = eval(code, _curve_namespace(form, namespace, True))
+            self.func_name = "%s -> %s" % (var, func)
+
 class Curve(Frame):
     """Represents a parameterized function.
 
@@ -2820,6 +3363,11 @@ class Curve(Frame):
        samples (number or `Auto`): number of sample points or `Auto`
        for dynamic sampling (_not yet copied over from SVGFig!_)
 
+       vectorize (bool): if True, a callable `func` is called once
+       with a numpy array of all the input values and must return an
+       array of the same length; otherwise, it is called once for
+       each value (numpy ufuncs are always called with arrays)
+
        linewidth (float): scale factor to resize line width
 
        linestyle (tuple or string): "solid", "dashed", "dotted", or a
@@ -2856,7 +3404,7 @@ class Curve(Frame):
 
     """
 
-    _not_frameargs = ["func", "varmin", "varmax", "parameters", "var", "namespace", "form", "samples", "linewidth", "linestyle", "linecolor", "FUNCTION", "PARAMETRIC", "COMPLEX"]
+    _not_frameargs = ["func", "varmin", "varmax", "parameters", "var", "namespace", "form", "samples", "vectorize", "linewidth", "linestyle", "linecolor", "FUNCTION", "PARAMETRIC", "COMPLEX"]
 
     class CurveType:
         def __init__(self, name): self.name = "Curve." + name
@@ -2866,34 +3414,98 @@ class Curve(Frame):
     PARAMETRIC = CurveType("PARAMETRIC")
     COMPLEX = CurveType("COMPLEX")
 
-    def __init__(self, func, varmin=Auto, varmax=Auto, parameters={}, var="x", namespace=None, form=FUNCTION, samples=1000, linewidth=1., linestyle="solid", linecolor="black", **frameargs):
-        self.func, self.varmin, self.varmax, self.parameters, self.var, self.namespace, self.form, self.samples, self.linewidth, self.linestyle, self.linecolor = func, varmin, varmax, parameters, var, namespace, form, samples, linewidth, linestyle, linecolor
+    def __init__(self, func, varmin=Auto, varmax=Auto, parameters={}, var="x", namespace=None, form=FUNCTION, samples=1000, linewidth=1., linestyle="solid", linecolor="black", vectorize=False, **frameargs):
+        self.func, self.varmin, self.varmax, self.parameters, self.var, self.namespace, self.form, self.samples, self.linewidth, self.linestyle, self.linecolor, self.vectorize = func, varmin, varmax, parameters, var, namespace, form, samples, linewidth, linestyle, linecolor, vectorize
         Frame.__init__(self, **frameargs)
 
     def _compile(self, parameters):
+        # string functions take the parameters as arguments (not globals), so they only need to be compiled once
         if callable(self.func):
-            self._func = lambda t: self.func(t, **parameters)
-            try:
-                self._func.func_name = self.func.func_name
-            except AttributeError:
-                self._func.func_name = "built-in"
+            parnames = tuple(sorted(parameters.keys()))
         else:
-            if self.form is self.COMPLEX: g = dict(cmath.__dict__)
-            else: g = dict(math.__dict__)
+            parnames = tuple(sorted([name for name in parameters.keys() if name != self.var and re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", name)]))
 
-            # missing these important functions
-            g["erf"] = mathtools.erf
-            g["erfc"] = mathtools.erfc
+        vectorize = bool(getattr(self, "vectorize", False))
+        try:
+            if callable(self.func):
+                namespace = None  # not used by callables
+            else:
+                # only the names in the expression matter; they are found once per function
+                if getattr(self, "_names", (None,))[0] is not self.func:
+                    self._names = (self.func, _referenced_names(self.func))
+                namespace = _namespace_key(self.namespace, self._names[1])
+            key = (self.func, self.var, parnames, self.form, vectorize, namespace)
+            compiled = _curvefunctions.pop(key, None)
+        except TypeError:
+            key, compiled = None, None
+        if compiled is None:
+            compiled = _CurveFunction(self.func, self.var, parnames, self.form, self.namespace, vectorize)
+        if key is not None:
+            _curvefunctions[key] = compiled
+            if len(_curvefunctions) > _curvefunctions_size:
+                _curvefunctions.popitem(last=False)
+
+        args = tuple([parameters[name] for name in parnames])
+        scalar, vector = compiled.scalar, compiled.vector
+        self._compiled = compiled
+        self._func = lambda t: scalar(t, *args)
+        self._func.func_name = compiled.func_name
+        self._vfunc = lambda t: vector(t, *args)
+        self._vfunc.func_name = compiled.func_name
+
+    def _vectorized(self, values, output):
+        """Evaluate the function on all `values` in one call, filling
+        `output`; return False if that can't be done."""
+
+        if not self._compiled.vectorizable:
+            return False
+
+        # integers keep Python's integer arithmetic, one at a time
+        values = numpy.asarray(values)
+        if values.dtype.kind != "f":
+            return False
 
-            if self.namespace is not None:
-                if isinstance(self.namespace, dict):
-                    g.update(self.namespace)
-                else:
-                    g.update(self.namespace.__dict__)
+        if callable(self.func):
+            # the function asked for arrays: call it once, and let its errors be its own
+            result = self._vfunc(values)
+            if not self._vectorresult(result, (values.shape,)):
+                raise ContainerException, "Curve function %s did not return one output per input when called with an array." % self._compiled.func_name
 
-            g.update(parameters)
-            self._func = eval("lambda (%s): (%s)" % (self.var, self.func), g)
-            self._func.func_name = "%s -> %s" % (self.var, self.func)
+        else:
+            try:
+                # raise (and fall back to the scalar loop) where the math module would raise
+                with numpy.errstate(divide="raise", over="raise", invalid="raise"):
+                    result = self._vfunc(values)
+                if not self._vectorresult(result, (values.shape, ())):   # constant expressions are broadcast
+                    raise TypeError
+
+            except FloatingPointError:
+                return False
+            except (TypeError, ValueError):
+                # the function is not written for arrays (e.g. an if expression or a math-only function)
+                self._compiled.vectorizable = False
+                return False
+            except Exception:
+                # let the scalar loop raise it, value by value
+                return False
+
+        if self.form is self.PARAMETRIC:
+            output[:,0], output[:,1] = result
+        else:
+            output[:] = result
+        return True
+
+    def _vectorresult(self, result, shapes):
+        # True if an array evaluation has the right shape (and no unexpected complex numbers)
+        if self.form is self.PARAMETRIC:
+            if not hasattr(result, "__len__") or len(result) != 2 or numpy.shape(result[0]) not in shapes or numpy.shape(result[1]) not in shapes:
+                return False
+            components = result
+        else:
+            if numpy.shape(result) not in shapes:
+                return False
+            components = (result,)
+        return self.form is self.COMPLEX or not any([numpy.iscomplexobj(x) for x in components])
 
     def __repr__(self):
         if callable(self.func):
@@ -2913,6 +3525,14 @@ class Curve(Frame):
 
            parameters (keyword arguments): parameter values for this
            set of evaluations
+
+        Behavior:
+           String functions are compiled once for each set of
+           parameter names and evaluated on all values at once with
+           numpy functions in place of math functions.  If that fails
+           (e.g. an `if` expression), the values are evaluated one at
+           a time.  Callable functions are called once per value,
+           unless they are numpy ufuncs or `vectorize` is True.
         """
 
         self._compile(parameters)
@@ -2932,11 +3552,12 @@ class Curve(Frame):
         else:
             raise ContainerException, "Curve.form must be one of Curve.FUNCTION, Curve.PARAMETRIC, or Curve.COMPLEX."
 
-        try:
-            for i, value in enumerate(values):
-                output[i] = self._func(value)
-        except NameError, err:
-            raise NameError, "%s: are the Curve's parameters missing (or namespace not set)?" % err
+        if not self._vectorized(values, output):
+            try:
+                for i, value in enumerate(values):
+                    output[i] = self._func(value)
+            except NameError, err:
+                raise NameError, "%s: are the Curve's parameters missing (or namespace not set)?" % err
 
         if singleton: output = output[0]
         return output
@@ -2947,33 +3568,70 @@ class Curve(Frame):
         Arguments:
            values (number or list of numbers): input(s) to the function
 
+           epsilon (number): half of the step used for the central difference
+
            parameters (keyword arguments): parameter values for this
            set of evaluations
         """
 
-        self._compile(parameters)
-
-        if isinstance(values, (numbers.Number, numpy.number)):
-            singleton = True
-            values = [values]
-        else:
-            singleton = False
-
-        if self.form is self.FUNCTION:
-            output = numpy.empty(len(values), dtype=numpy.float)
-        elif self.form is self.PARAMETRIC:
-            output = numpy.empty((len(values), 2), dtype=numpy.float)
-        elif self.form is self.COMPLEX:
+        if self.form is self.COMPLEX:
             raise ContainerException, "Curve.derivative not implemented for COMPLEX functions."
-        else:
+        elif self.form is not self.FUNCTION and self.form is not self.PARAMETRIC:
             raise ContainerException, "Curve.form must be one of Curve.FUNCTION, Curve.PARAMETRIC, or Curve.COMPLEX."
 
-        for i, value in enumerate(values):
-            up = self._func(value + mathtools.epsilon)
-            down = self._func(value - mathtools.epsilon)
-            output[i] = (up - down)/(2. * mathtools.epsilon)
+        if not isinstance(values, (numbers.Number, numpy.number)):
+            values = numpy.asarray(values, dtype=numpy.float)
 
-        if singleton: output = output[0]
+        up = self(values + epsilon, **parameters)
+        down = self(values - epsilon, **parameters)
+        return (up - down)/(2. * epsilon)
+
+    def gradient(self, values, epsilon=mathtools.epsilon, **parameters):
+        """Calculate the derivatives of the function with respect to its parameters.
+
+        Arguments:
+           values (number or list of numbers): input(s) to the function
+
+           epsilon (number): relative step for numerical derivatives
+
+           parameters (keyword arguments): parameter values for this
+           set of evaluations
+
+        Behavior:
+           Returns a dict from parameter name to derivatives at `values`.
+
+           String functions made of arithmetic and common math
+           functions (exp, log, sqrt, trigonometric, hyperbolic, erf)
+           are differentiated symbolically and evaluated like the
+           function itself.  Otherwise, each derivative is a central
+           difference with a step of `epsilon` times the parameter
+           (or `epsilon` if the parameter is smaller than 1).
+        """
+
+        if self.form is not self.FUNCTION:
+            raise ContainerException, "Curve.gradient is only implemented for Curve.FUNCTION."
+
+        self._compile(parameters)
+        parnames = self._compiled.parnames
+
+        symbolic = not callable(self.func)
+        if symbolic and self.namespace is not None:
+            # a namespace could redefine the functions in the derivatives
+            if isinstance(self.namespace, dict): names = self.namespace.keys()
+            else: names = self.namespace.__dict__.keys()
+            symbolic = _derivative_names.isdisjoint(names)
+
+        output = {}
+        for name in parnames:
+            expression = (_curve_derivative(self.func, self.var, name) if symbolic else None)
+            if expression is not None and _derivative_names.isdisjoint(parnames):
+                output[name] = Curve(expression, var=self.var, namespace=self.namespace)(values, **parameters)
+            else:
+                step = epsilon * max(abs(parameters[name]), 1.)
+                up, down = dict(parameters), dict(parameters)
+                up[name] += step
+                down[name] -= step
+                output[name] = (self(values, **up) - self(values, **down))/(2. * step)
         return output
     
     def scatter(self, low, high, samples=Auto, xlog=False, **parameters):
@@ -3018,8 +3676,8 @@ class Curve(Frame):
             tmp = self(numpy.arange(low, high + 0.5*step, step), **parameters)
 
             points = numpy.empty((samples, 2), dtype=numpy.float)
-            for i, value in enumerate(tmp):
-                points[i] = value.real, value.imag
+            points[:,0] = tmp.real
+            points[:,1] = tmp.imag
 
         else: raise ContainerException, "Curve.form must be one of Curve.FUNCTION, Curve.PARAMETRIC, or Curve.COMPLEX."
 
@@ -3098,6 +3756,28 @@ best fit to a given dataset.
 
            centroids (bool): use centroids of histogram, rather than
            centers
+
+        Behavior:
+           `exclude` is applied once, when the objective function is
+           made (the `Auto` and `None` exclusions as numpy array
+           comparisons); the objective function's `included` member
+           is a boolean array that is True for the data points that
+           are used.  The default chi^2 methods and
+           `mathtools.gaussian_likelihood` and
+           `mathtools.poisson_likelihood` are computed for all data
+           points at once with numpy; any other `method` is called
+           for each point.
+
+           The objective function has a `gradient` member, which
+           takes the same arguments and returns the list of partial
+           derivatives in the order of `parnames`.  For the methods
+           above, it is computed from `Curve.gradient` with the chain
+           rule; otherwise, by central differences of the objective.
+
+           For the chi^2 methods and `mathtools.gaussian_likelihood`,
+           the objective also has `residuals` and `jacobian` members
+           (the objective is the sum of squared residuals), which
+           least-squares minimizers can use.
         """
 
         if isinstance(data, Histogram):
@@ -3105,45 +3785,42 @@ best fit to a given dataset.
                 raise ContainerException, "A fit to a categorical histogram is not meaningful."
 
             if exclude is Auto and method is Auto:
-                exclude = lambda x, y: y == 0.
+                exclude = _exclude_zero_y
             else:
-                exclude = lambda x, y: False
-            self._exclude = exclude
+                exclude = _exclude_nothing
 
             if method is Auto:
-                method = lambda f, x, y: (f - y)**2/abs(y)
+                method = _chi2_relative
 
             values = numpy.empty((len(data.bins), 2), dtype=numpy.float)
             if centroids: values[:,0] = data.centroids()
             else: values[:,0] = data.centers()
             values[:,1] = data.values
 
-            return eval("lambda %s: sum([method(f, x, y) for f, (x, y) in itertools.izip(curve(values[:,0], **{%s}), values) if not exclude(x, y)])" % (", ".join(parnames), ", ".join(["\"%s\": %s" % (x, x) for x in parnames])), {"method": method, "itertools": itertools, "curve": self, "values": values, "exclude": exclude})
+            return self._objective(values, parnames, method, exclude)
 
         elif isinstance(data, Scatter):
             if "ey" in data.sig and "eyl" in data.sig:
                 if method is Auto:
-                    method = lambda f, x, y, ey, eyl: ((f - y)**2/eyl**2 if f < y else (f - y)**2/ey**2)
+                    method = _chi2_asymmetric
                 if exclude is Auto:
-                    exclude = lambda x, y, ey, eyl: eyl == 0. or ey == 0.
+                    exclude = _exclude_zero_errors
                 elif exclude is None:
-                    exclude = lambda x, y, ey, eyl: False
+                    exclude = _exclude_nothing
 
             elif "ey" in data.sig:
                 if method is Auto:
-                    method = lambda f, x, y, ey: (f - y)**2/ey**2
+                    method = _chi2_errors
                 if exclude is Auto:
-                    exclude = lambda x, y, ey: ey == 0.
+                    exclude = _exclude_zero_ey
                 elif exclude is None:
-                    exclude = lambda x, y, ey: False
+                    exclude = _exclude_nothing
 
             else:
                 if method is Auto:
-                    method = lambda f, x, y: (f - y)**2
+                    method = _chi2
                 if exclude is Auto or exclude is None:
-                    exclude = lambda x, y: False
-
-            self._exclude = exclude
+                    exclude = _exclude_nothing
 
             index = data.index()
             if "ey" in data.sig and "eyl" in data.sig:
@@ -3152,25 +3829,86 @@ best fit to a given dataset.
                 values[:,1] = data.values[:,index["y"]]
                 values[:,2] = data.values[:,index["ey"]]
                 values[:,3] = data.values[:,index["eyl"]]
-                return eval("lambda %s: sum([method(f, x, y, ey, eyl) for f, (x, y, ey, eyl) in itertools.izip(curve(values[:,0], **{%s}), values) if not exclude(x, y, ey, eyl)])" % (", ".join(parnames), ", ".join(["\"%s\": %s" % (x, x) for x in parnames])), {"method": method, "itertools": itertools, "curve": self, "values": values, "exclude": exclude})
+                return self._objective(values, parnames, method, exclude)
 
             elif "ey" in data.sig:
                 values = numpy.empty((len(data.values), 3))
                 values[:,0] = data.values[:,index["x"]]
                 values[:,1] = data.values[:,index["y"]]
                 values[:,2] = data.values[:,index["ey"]]
-                return eval("lambda %s: sum([method(f, x, y, ey) for f, (x, y, ey) in itertools.izip(curve(values[:,0], **{%s}), values) if not exclude(x, y, ey)])" % (", ".join(parnames), ", ".join(["\"%s\": %s" % (x, x) for x in parnames])), {"method": method, "itertools": itertools, "curve": self, "values": values, "exclude": exclude})
+                return self._objective(values, parnames, method, exclude)
 
             else:
                 values = numpy.empty((len(data.values), 2))
                 values[:,0] = data.values[:,index["x"]]
                 values[:,1] = data.values[:,index["y"]]
-                return eval("lambda %s: sum([method(f, x, y) for f, (x, y) in itertools.izip(curve(values[:,0], **{%s}), values) if not exclude(x, y)])" % (", ".join(parnames), ", ".join(["\"%s\": %s" % (x, x) for x in parnames])), {"method": method, "itertools": itertools, "curve": self, "values": values, "exclude": exclude})
+                return self._objective(values, parnames, method, exclude)
 
         else:
             raise ContainerException, "Data for Curve.objective must be a Histogram or a Scatter plot."
 
-    def fit(self, data, parameters=Auto, sequence=[("migrad",)], method=Auto, exclude=Auto, centroids=False, **fitter_arguments):
+    def _objective(self, values, parnames, method, exclude):
+        # data points are rows of x, y[, ey[, eyl]]
+        included = _included(exclude, values)
+        values = values[included]
+        x = values[:,0]
+        columns = tuple(values.T)
+
+        try:
+            vectorized = (method in _vectorized_methods)
+        except TypeError:
+            vectorized = False
+
+        if vectorized:
+            def objective(parameters):
+                return method(self(x, **parameters), *columns).sum()
+        else:
+            def objective(parameters):
+                return sum([method(f, *row) for f, row in itertools.izip(self(x, **parameters), values)])
+
+        if vectorized and method in _method_derivatives and self.form is self.FUNCTION:
+            derivative = _method_derivatives[method]
+            def gradient(parameters):
+                # chain rule: d(objective)/dp = sum of d(method)/df * df/dp
+                dmethod = derivative(self(x, **parameters), *columns)
+                partials = self.gradient(x, **parameters)
+                return [(dmethod * partials[name]).sum() if name in partials else 0. for name in parnames]
+        else:
+            def gradient(parameters):
+                output = []
+                for name in parnames:
+                    step = mathtools.epsilon * max(abs(parameters[name]), 1.)
+                    up, down = dict(parameters), dict(parameters)
+                    up[name] += step
+                    down[name] -= step
+                    output.append((objective(up) - objective(down))/(2. * step))
+                return output
+
+        # the fitter identifies parameters by the names of the function's arguments
+        signature = "lambda %s: %%s({%s})" % (", ".join(parnames), ", ".join(["\"%s\": %s" % (name, name) for name in parnames]))
+        output = eval(signature % "objective", {"objective": objective})
+        output.gradient = eval(signature % "gradient", {"gradient": gradient})
+
+        if vectorized and method in _method_weights and self.form is self.FUNCTION:
+            weight = _method_weights[method]
+            y = columns[1]
+            def residuals(parameters):
+                f = self(x, **parameters)
+                return (f - y) * weight(f, *columns)
+            def jacobian(parameters):
+                w = weight(self(x, **parameters), *columns)
+                partials = self.gradient(x, **parameters)
+                output = numpy.zeros((len(x), len(parnames)))
+                for i, name in enumerate(parnames):
+                    if name in partials: output[:,i] = w * partials[name]
+                return output
+            output.residuals = eval(signature % "residuals", {"residuals": residuals})
+            output.jacobian = eval(signature % "jacobian", {"jacobian": jacobian})
+
+        output.included = included
+        return output
+
+    def fit(self, data, parameters=Auto, sequence=[("migrad",)], method=Auto, exclude=Auto, centroids=False, minimizer=Auto, **fitter_arguments):
         """Fit this curve to a given dataset, updating its `parameters` and creating a `minimizer` member.
 
         Arguments:
@@ -3179,8 +3917,8 @@ best fit to a given dataset.
            parameters (dict of strings -> values): the initial
            parameters for the fit
 
-           sequence (list of (string, arg, arg)): sequence of Minuit
-           commands to call, with optional arguments
+           sequence (list of (string, arg, arg)): sequence of
+           minimizer commands to call, with optional arguments
 
            method (function or `Auto`): a function that will be called
            for each data point to calculate the final value of the
@@ -3201,70 +3939,34 @@ best fit to a given dataset.
            centroids (bool): use centroids of histogram, rather than
            centers
 
+           minimizer (class or `Auto`): called with the objective
+           function to make the `minimizer` member, which must have
+           `values`, `errors` and `fval` members and a method for each
+           command in `sequence`; if `Auto`, PyMinuit's `Minuit` if it
+           is installed and `mathtools.Minimizer` otherwise
+
         Keyword arguments:
 
-           Keyword arguments will be passed to the Minuit object as member data.
+           Keyword arguments will be passed to the minimizer object as member data.
         """
 
         if parameters is Auto: parameters = self.parameters
+        if minimizer is Auto:
+            if minuit is None: minimizer = mathtools.Minimizer
+            else: minimizer = minuit.Minuit
 
-        self.minimizer = minuit.Minuit(self.objective(data, parameters.keys(), method=method, exclude=exclude, centroids=centroids))
+        objective = self.objective(data, parameters.keys(), method=method, exclude=exclude, centroids=centroids)
+        self.minimizer = minimizer(objective)
         for name, value in fitter_arguments.items():
-            exec("self.minimizer.%s = %s" % (name, str(value)))
+            setattr(self.minimizer, name, value)
         self.minimizer.values = parameters
 
-        # this block is just to set ndf (with all exclusions applied)
-        ndf = 0
-        if isinstance(data, Histogram):
-            if isinstance(data, HistogramCategorical):
-                raise ContainerException, "A fit to a categorical histogram is not meaningful."
-            values = numpy.empty((len(data.bins), 2), dtype=numpy.float)
-            if centroids: values[:,0] = data.centroids()
-            else: values[:,0] = data.centers()
-            values[:,1] = data.values
-            for x, y in values:
-                if not self._exclude(x, y):
-                    ndf += 1
-        elif isinstance(data, Scatter):
-            index = data.index()
-            if "ey" in data.sig and "eyl" in data.sig:
-                values = numpy.empty((len(data.values), 4))
-                values[:,0] = data.values[:,index["x"]]
-                values[:,1] = data.values[:,index["y"]]
-                values[:,2] = data.values[:,index["ey"]]
-                values[:,3] = data.values[:,index["eyl"]]
-                for x, y, ey, eyl in values:
-                    if not self._exclude(x, y, ey, eyl):
-                        ndf += 1
-            elif "ey" in data.sig:
-                values = numpy.empty((len(data.values), 3))
-                values[:,0] = data.values[:,index["x"]]
-                values[:,1] = data.values[:,index["y"]]
-                values[:,2] = data.values[:,index["ey"]]
-                for x, y, ey in values:
-                    if not self._exclude(x, y, ey):
-                        ndf += 1
-            else:
-                values = numpy.empty((len(data.values), 2))
-                values[:,0] = data.values[:,index["x"]]
-                values[:,1] = data.values[:,index["y"]]
-                for x, y in values:
-                    if not self._exclude(x, y):
-                        ndf += 1
-        else:
-            raise ContainerException, "Data for Curve.objective must be a Histogram or a Scatter plot."
-
-        ndf -= len(parameters)
-        # end block to set ndf
+        # number of degrees of freedom, with all exclusions applied
+        ndf = int(objective.included.sum()) - len(parameters)
 
         try:
             for command in sequence:
-                name = command[0]
-                args = list(command[1:])
-                for i in range(len(args)):
-                    if isinstance(args[i], basestring): args[i] = "\"%s\"" % args[i]
-                    else: args[i] = str(args[i])
-                eval("self.minimizer.%s(%s)" % (name, ", ".join(args)))
+                getattr(self.minimizer, command[0])(*command[1:])
         except Exception as tmp:
             self.parameters = self.minimizer.values
             self.chi2 = self.minimizer.fval
@@ -3328,6 +4030,84 @@ plus-minus sign."""
 
         return output
 
+# (curve, datasets, parameters, fit arguments) for fit_many's worker processes, which inherit it by fork
+_fit_jobs = None
+
+def _fit_one(index):
+    """Fit a copy of the fit_many curve to one dataset and return its results row."""
+
+    curve, datasets, parameters, fit_arguments = _fit_jobs
+    parnames = sorted(parameters.keys())
+    nan = float("nan")
+
+    fitted = copy.copy(curve)
+    fitted.parameters = dict(parameters)
+    try:
+        fitted.fit(datasets[index], **fit_arguments)
+    except Exception:
+        return (tuple([nan] * len(parnames)), tuple([nan] * len(parnames)), nan, 0, nan, False)
+
+    errors = fitted.minimizer.errors
+    return (tuple([fitted.parameters[name] for name in parnames]), tuple([errors.get(name, nan) for name in parnames]), fitted.chi2, fitted.ndf, fitted.normalizedChi2, True)
+
+def fit_many(curve, datasets, parameters=Auto, processes=None, **fit_arguments):
+    """Fit the same Curve to many datasets, each with a fresh copy of the Curve.
+
+    Arguments:
+       curve (`Curve`): the function to fit; it is not modified
+
+       datasets (list of `Histogram` or `Scatter`): the data to fit
+
+       parameters (dict or `Auto`): initial parameters for every fit;
+       if `Auto`, use `curve.parameters`
+
+       processes (int or `None`): number of worker processes; `None`
+       or 1 fits everything in this process
+
+       `**fit_arguments`: passed to `Curve.fit` (`sequence`,
+       `method`, `exclude`, `centroids`, `minimizer`, and minimizer
+       members)
+
+    Behavior:
+       Returns a numpy record array with one row per dataset (empty
+       if there are no datasets) and fields "parameters" and "errors"
+       (each with a field for each parameter name), "chi2", "ndf",
+       "normalizedChi2", and "ok", which is False if the fit raised
+       an exception (the other fields are then NaN).
+
+       Worker processes are forked and inherit `curve` and
+       `datasets`, so these don't need to be picklable; only the
+       results are sent back.  This requires `multiprocessing` and
+       `os.fork`; otherwise, the fits are done serially.
+    """
+
+    global _fit_jobs
+
+    if parameters is Auto: parameters = curve.parameters
+    parnames = sorted(parameters.keys())
+    dtype = [("parameters", [(name, numpy.float) for name in parnames]), ("errors", [(name, numpy.float) for name in parnames]), ("chi2", numpy.float), ("ndf", numpy.int), ("normalizedChi2", numpy.float), ("ok", numpy.bool)]
+
+    _fit_jobs = (curve, datasets, dict(parameters), fit_arguments)
+    try:
+        if processes is not None and processes > 1 and len(datasets) > 1 and multiprocessing is not None and hasattr(os, "fork"):
+            pool = multiprocessing.Pool(min(processes, len(datasets)))
+            try:
+                rows = pool.map(_fit_one, range(len(datasets)), chunksize=max(1, len(datasets) // (4 * processes)))
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            rows = map(_fit_one, range(len(datasets)))
+    finally:
+        _fit_jobs = None
+
+    if len(rows) == 0:
+        return numpy.rec.array(numpy.empty(0, dtype=dtype))
+    return numpy.rec.array(rows, dtype=dtype)
+
 ######################################################### Grids, horiz/vert lines, annotations
 
 class Line(Frame):
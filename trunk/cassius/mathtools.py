@@ -465,17 +465,22 @@ def ubiquitous(array):
             return None
 
 def erf(x):
-    """Return the error function of x.
+    """Return the error function of x (a number or a numpy array).
 
     (For complex erf, get SciPy and load scipy.special)
     """
 
-    # http://stackoverflow.com/questions/457408/is-there-an-easily-available-implementation-of-erf-for-python
-    sign = 1
-    if x < 0: 
-        sign = -1
+    if isinstance(x, numpy.ndarray):
+        sign = numpy.where(x < 0, -1., 1.)
+        exp = numpy.exp
+    else:
+        sign = 1
+        if x < 0: 
+            sign = -1
+        exp = math.exp
     x = abs(x)
 
+    # http://stackoverflow.com/questions/457408/is-there-an-easily-available-implementation-of-erf-for-python
     a1 =  0.254829592
     a2 = -0.284496736
     a3 =  1.421413741
@@ -485,11 +490,11 @@ def erf(x):
 
     # http://www.amazon.com/dp/0486612724/?tag=stackoverfl08-20 formula 7.1.26
     t = 1.0/(1.0 + p*x)
-    y = 1.0 - (((((a5*t + a4)*t) + a3)*t + a2)*t + a1)*t*math.exp(-x*x)
+    y = 1.0 - (((((a5*t + a4)*t) + a3)*t + a2)*t + a1)*t*exp(-x*x)
     return sign*y # erf(-x) = -erf(x)
 
 def erfc(x):
-    """Return 1 minus the error function of x.
+    """Return 1 minus the error function of x (a number or a numpy array).
 
     (For complex erfc, get SciPy and load scipy.special)
     """
@@ -504,10 +509,52 @@ def gaussian_likelihood(f, x, y, ey):
 
        where f is the value of the curve at x, y is the data, and ey
        is the uncertainty in the data (one Gaussian sigma).
+
+       All arguments may be numpy arrays.
     """
 
+    if isinstance(ey, numpy.ndarray):
+        nonzero = (ey != 0.)
+        return numpy.where(nonzero, (f - y)**2/numpy.where(nonzero, ey, 1.)**2, 0.)
     return ((f - y)**2/ey**2 if ey != 0. else 0.)
 
+# log(n!) for n = 0, 1, 2, ...; grown on demand by _log_factorial
+_logfactorial = numpy.zeros(1)
+_logfactorial_maximum = 1 << 20
+
+def _grow_logfactorial(n):
+    global _logfactorial
+    old = len(_logfactorial)
+    new = min(max(n + 1, 2*old), _logfactorial_maximum)
+    if new > old:
+        # continue the running sum so that entries agree with sum(map(math.log, xrange(1, n+1)))
+        _logfactorial = numpy.concatenate((_logfactorial[:-1], numpy.cumsum(numpy.concatenate(([_logfactorial[-1]], numpy.log(numpy.arange(old, new)))))))
+
+def _log_factorial(y):
+    """log(y!) for a number or numpy array y; log(Gamma(y+1)) if y is not an integer and 0 if y <= 0."""
+
+    if isinstance(y, numpy.ndarray):
+        y = numpy.maximum(y, 0.)
+        n = y.astype(numpy.int64)
+        integer = (n == y) & (n < _logfactorial_maximum)
+        if numpy.any(integer):
+            largest = n[integer].max()
+            if largest >= len(_logfactorial):
+                _grow_logfactorial(largest)
+
+        output = numpy.empty(y.shape, dtype=numpy.float)
+        output[integer] = _logfactorial[n[integer]]
+        if not numpy.all(integer):
+            output[~integer] = [math.lgamma(value + 1.) for value in y[~integer]]
+        return output
+
+    if y <= 0: return 0.
+    if y == int(y) and y < _logfactorial_maximum:
+        if y >= len(_logfactorial):
+            _grow_logfactorial(int(y))
+        return float(_logfactorial[int(y)])
+    return math.lgamma(y + 1.)
+
 def poisson_likelihood(f, x, y):
     """Poisson likelihood function usable in Curve.objective and Curve.fit.
 
@@ -518,6 +565,8 @@ def poisson_likelihood(f, x, y):
        where f is the value of the curve at x and y is the data
        (usually an integer, like a histogram bin value).
 
+       All arguments may be numpy arrays.
+
     Considerations:
 
        Note the factor of 2!  Not all texts include this factor.  With
@@ -526,20 +575,373 @@ def poisson_likelihood(f, x, y):
        uncertainty in a best fit value is the distance you need to
        walk to raise this objective function by 1.0, just like the
        Gaussian likelihood (not 0.5!).
+
+       log(y!) is looked up in a table that grows as larger y are
+       seen (up to 2**20); beyond that, or for non-integer y, it is
+       log(Gamma(y+1)).
     """
 
-    # try:
-    #     return -2.*(y*math.log(f) - f - math.log(math.factorial(y)))
-    # except ValueError:
-    #     return -2.*(y*math.log(1e-10) - 1e-10 - math.log(math.factorial(y)))
+    if isinstance(f, numpy.ndarray) or isinstance(y, numpy.ndarray):
+        # note: if f == 0., then any non-zero y is impossible; same small value as below
+        f = numpy.where(numpy.asarray(f) <= 0., 1e-10, f)
+        return -2.*(y*numpy.log(f) - f - _log_factorial(numpy.asarray(y, dtype=numpy.float)))
 
-    ### much better:
     try:
-        return -2.*(y*math.log(f) - f - sum(map(math.log, xrange(1, y+1))))
+        return -2.*(y*math.log(f) - f - _log_factorial(y))
     except ValueError:
         # note: if f == 0., then any non-zero y is impossible
         # is it right to give it a small value?  something to think about...
-        return -2.*(y*math.log(1e-10) - 1e-10 - sum(map(math.log, xrange(1, y+1))))
+        return -2.*(y*math.log(1e-10) - 1e-10 - _log_factorial(y))
+
+class Minimizer:
+    """Minimize an objective function with NumPy alone; usable in
+    place of PyMinuit's `Minuit` in `Curve.fit`.
+
+    Arguments:
+       objective (function): takes the parameters as arguments (by
+       name) and returns a number; if it has `gradient`, `residuals`
+       and `jacobian` members, like the functions made by
+       `Curve.objective`, they are used
+
+    Public members:
+       values (dict): parameter values, starting with the initial
+       guess and replaced by the best fit
+
+       errors (dict): initial step sizes (default is 10% of the
+       value, or 0.1 for zero); after `migrad`, `hesse`,
+       `levenberg_marquardt` or `bfgs`, parameter uncertainties, and
+       after `simplex` or `nelder_mead`, the step sizes it started
+       with, as rough uncertainties
+
+       covariance (dict of (name, name) pairs -> number): covariance
+       matrix after `migrad`, `hesse` or `levenberg_marquardt`
+
+       fixed (dict of name -> bool): parameters that are not varied
+
+       fval (number): value of the objective at `values`
+
+       edm (number): estimated vertical distance to the minimum
+
+       ncalls (int): number of times the objective has been evaluated
+
+       up (number): change in the objective that corresponds to one
+       standard deviation (1. for chi^2 and the likelihoods in this
+       module)
+
+       tol (number): minimization stops when `edm` is less than
+       0.001 * `tol` * `up`, as in Minuit
+
+       maxcalls (int): minimization stops after this many calls
+
+    Commands (names to use in `Curve.fit`'s `sequence`):
+       migrad(): `levenberg_marquardt` if the objective has
+       residuals (chi^2), `bfgs` otherwise, followed by `hesse`
+
+       simplex(): `nelder_mead`
+
+       hesse(): uncertainties from the numerical second derivatives
+
+       levenberg_marquardt(), bfgs(), nelder_mead(): each algorithm alone
+
+    Considerations:
+       The command and member names follow PyMinuit's, so a
+       `Curve.fit` `sequence` and keyword arguments written for one
+       work for the other.  Parameter limits are not implemented:
+       setting a member not listed above (such as PyMinuit's
+       `limits`) raises AttributeError, rather than being ignored.
+    """
+
+    _members = frozenset(["objective", "parnames", "values", "errors", "covariance", "fixed", "fval", "edm", "ncalls", "up", "tol", "maxcalls"])
+
+    def __init__(self, objective):
+        self.objective = objective
+        code = objective.func_code
+        self.parnames = list(code.co_varnames[:code.co_argcount])
+
+        self.values = dict([(name, 0.) for name in self.parnames])
+        self.errors = {}
+        self.covariance = {}
+        self.fixed = {}
+        self.fval = None
+        self.edm = None
+        self.ncalls = 0
+        self.up = 1.
+        self.tol = 0.1
+        self.maxcalls = 10000
+
+    def __setattr__(self, name, value):
+        if name not in self._members:
+            raise AttributeError, "Minimizer has no member \"%s\" (PyMinuit options such as limits are not implemented)" % name
+        self.__dict__[name] = value
+
+    def __repr__(self):
+        return "<Minimizer %s at 0x%x>" % (self.values, id(self))
+
+    # parameters as vectors of the free (non-fixed) ones
+
+    def _free(self):
+        return [name for name in self.parnames if not self.fixed.get(name, False)]
+
+    def _vector(self, free):
+        return numpy.array([self.values[name] for name in free], dtype=numpy.float)
+
+    def _steps(self, free):
+        steps = []
+        for name in free:
+            step = self.errors.get(name, 0.)
+            if not step > 0.:
+                step = 0.1 * abs(self.values[name])
+            if not step > 0.:
+                step = 0.1
+            steps.append(step)
+        return numpy.array(steps)
+
+    def _arguments(self, free, vector):
+        values = dict(self.values)
+        values.update(zip(free, vector))
+        return [values[name] for name in self.parnames]
+
+    def _call(self, free, vector):
+        self.ncalls += 1
+        return float(self.objective(*self._arguments(free, vector)))
+
+    def _gradient(self, free, vector):
+        gradient = getattr(self.objective, "gradient", None)
+        if gradient is not None:
+            self.ncalls += 1
+            output = gradient(*self._arguments(free, vector))
+            return numpy.array([output[self.parnames.index(name)] for name in free], dtype=numpy.float)
+
+        output = numpy.empty(len(free))
+        for i in xrange(len(free)):
+            step = epsilon * max(abs(vector[i]), 1.)
+            up, down = vector.copy(), vector.copy()
+            up[i] += step
+            down[i] -= step
+            output[i] = (self._call(free, up) - self._call(free, down))/(2. * step)
+        return output
+
+    def _finish(self, free, vector, fval):
+        # parameters without an uncertainty keep the step sizes that the minimization started with
+        errors = dict(self.errors)
+        for name, step in zip(free, self._steps(free).tolist()):
+            errors.setdefault(name, step)
+        self.errors = errors
+
+        values = dict(self.values)
+        values.update(zip(free, vector.tolist()))
+        self.values = values
+        self.fval = fval
+
+    def _set_covariance(self, free, covariance):
+        self.covariance = {}
+        errors = dict(self.errors)
+        for i, name in enumerate(free):
+            errors[name] = (math.sqrt(covariance[i,i]) if covariance[i,i] >= 0. else float("nan"))
+            for j, name2 in enumerate(free):
+                self.covariance[name, name2] = covariance[i,j]
+        self.errors = errors
+
+    def _converged(self):
+        return self.edm is not None and self.edm < 0.001 * self.tol * self.up
+
+    # commands
+
+    def migrad(self):
+        """Minimize with `levenberg_marquardt` if the objective has
+        residuals, `bfgs` otherwise, then calculate errors with `hesse`."""
+
+        if getattr(self.objective, "residuals", None) is not None and getattr(self.objective, "jacobian", None) is not None:
+            self.levenberg_marquardt()
+        else:
+            self.bfgs()
+        self.hesse()
+
+    def simplex(self):
+        """Minimize with `nelder_mead`."""
+
+        self.nelder_mead()
+
+    def levenberg_marquardt(self):
+        """Minimize a sum of squared residuals, using the objective's
+        `residuals` and `jacobian` members."""
+
+        residuals, jacobian = getattr(self.objective, "residuals", None), getattr(self.objective, "jacobian", None)
+        if residuals is None or jacobian is None:
+            raise ValueError, "levenberg_marquardt requires an objective with residuals and jacobian members (a chi^2 method)"
+
+        free = self._free()
+        columns = [self.parnames.index(name) for name in free]
+        vector = self._vector(free)
+
+        def evaluate(vector):
+            self.ncalls += 1
+            arguments = self._arguments(free, vector)
+            r = numpy.asarray(residuals(*arguments), dtype=numpy.float)
+            return r, numpy.dot(r, r), arguments
+
+        def linearize(arguments, r):
+            J = numpy.asarray(jacobian(*arguments), dtype=numpy.float)[:,columns]
+            return numpy.dot(J.T, J), numpy.dot(J.T, r)
+
+        # alpha (J^T J) and beta (J^T r) always describe the current vector, so the covariance is for the final one
+        r, chi2, arguments = evaluate(vector)
+        alpha, beta = linearize(arguments, r)
+        lam = 1e-3
+        while self.ncalls < self.maxcalls:
+            try:
+                self.edm = numpy.dot(beta, numpy.linalg.solve(alpha, beta))
+            except numpy.linalg.LinAlgError:
+                self.edm = None
+            if self._converged(): break
+
+            scale = numpy.diag(alpha).copy()
+            scale[scale <= 0.] = 1.
+            improved = False
+            while self.ncalls < self.maxcalls and lam < 1e10:
+                try:
+                    step = numpy.linalg.solve(alpha + lam * numpy.diag(scale), -beta)
+                except numpy.linalg.LinAlgError:
+                    lam *= 10.
+                    continue
+                rnew, chi2new, argumentsnew = evaluate(vector + step)
+                if chi2new < chi2:
+                    vector, r, chi2, arguments = vector + step, rnew, chi2new, argumentsnew
+                    alpha, beta = linearize(arguments, r)
+                    lam = max(lam / 10., 1e-12)
+                    improved = True
+                    break
+                lam *= 10.
+            if not improved: break
+
+        self._finish(free, vector, self._call(free, vector))
+        try:
+            self._set_covariance(free, self.up * numpy.linalg.inv(alpha))
+        except numpy.linalg.LinAlgError:
+            pass
+
+    def bfgs(self):
+        """Minimize the objective with the Broyden-Fletcher-Goldfarb-Shanno
+        quasi-Newton method, using the objective's `gradient` member
+        if it has one."""
+
+        free = self._free()
+        vector = self._vector(free)
+        fval = self._call(free, vector)
+        gradient = self._gradient(free, vector)
+
+        # initial inverse Hessian from the diagonal second derivatives, like Minuit
+        steps = self._steps(free)
+        diagonal = numpy.empty(len(free))
+        for i in xrange(len(free)):
+            shifted = vector.copy()
+            shifted[i] += steps[i]
+            second = (self._gradient(free, shifted)[i] - gradient[i]) / steps[i]
+            diagonal[i] = (1./second if second > 0. else steps[i]**2)
+        start = numpy.diag(diagonal)
+        inverse = start.copy()
+
+        while self.ncalls < self.maxcalls:
+            self.edm = 0.5 * numpy.dot(gradient, numpy.dot(inverse, gradient))
+            if self._converged(): break
+
+            direction = -numpy.dot(inverse, gradient)
+            slope = numpy.dot(gradient, direction)
+            if not slope < 0.:
+                inverse = start.copy()
+                direction = -numpy.dot(inverse, gradient)
+                slope = numpy.dot(gradient, direction)
+
+            # backtracking line search (Armijo condition)
+            step = 1.
+            while self.ncalls < self.maxcalls:
+                trial = vector + step * direction
+                ftrial = self._call(free, trial)
+                if ftrial <= fval + 1e-4 * step * slope: break
+                step *= 0.5
+                if step < 1e-10: break
+            if not ftrial <= fval: break
+
+            gtrial = self._gradient(free, trial)
+            s = trial - vector
+            y = gtrial - gradient
+            sy = numpy.dot(s, y)
+            if sy > 0.:
+                identity = numpy.eye(len(free))
+                inverse = numpy.dot(identity - numpy.outer(s, y)/sy, numpy.dot(inverse, identity - numpy.outer(y, s)/sy)) + numpy.outer(s, s)/sy
+
+            vector, fval, gradient = trial, ftrial, gtrial
+
+        self._finish(free, vector, fval)
+        self._set_covariance(free, 2. * self.up * inverse)
+
+    def nelder_mead(self):
+        """Minimize the objective with the Nelder-Mead simplex method,
+        which uses no derivatives."""
+
+        free = self._free()
+        vector = self._vector(free)
+        steps = self._steps(free)
+
+        points = [vector] + [vector + steps[i] * numpy.eye(len(free))[i] for i in xrange(len(free))]
+        fvals = [self._call(free, point) for point in points]
+
+        while self.ncalls < self.maxcalls:
+            order = numpy.argsort(fvals)
+            points = [points[i] for i in order]
+            fvals = [fvals[i] for i in order]
+            self.edm = fvals[-1] - fvals[0]
+            if self._converged(): break
+
+            centroid = numpy.mean(points[:-1], axis=0)
+            reflected = centroid + (centroid - points[-1])
+            freflected = self._call(free, reflected)
+
+            if freflected < fvals[0]:
+                expanded = centroid + 2.*(centroid - points[-1])
+                fexpanded = self._call(free, expanded)
+                if fexpanded < freflected: points[-1], fvals[-1] = expanded, fexpanded
+                else: points[-1], fvals[-1] = reflected, freflected
+
+            elif freflected < fvals[-2]:
+                points[-1], fvals[-1] = reflected, freflected
+
+            else:
+                contracted = centroid + 0.5*(points[-1] - centroid)
+                fcontracted = self._call(free, contracted)
+                if fcontracted < fvals[-1]:
+                    points[-1], fvals[-1] = contracted, fcontracted
+                else:
+                    # shrink toward the best point
+                    for i in xrange(1, len(points)):
+                        points[i] = points[0] + 0.5*(points[i] - points[0])
+                        fvals[i] = self._call(free, points[i])
+
+        best = int(numpy.argmin(fvals))
+        self._finish(free, points[best], fvals[best])
+
+    def hesse(self):
+        """Calculate `errors` and `covariance` from the numerical second
+        derivatives of the objective at `values`."""
+
+        free = self._free()
+        vector = self._vector(free)
+        steps = 1e-3 * self._steps(free)
+        n = len(free)
+
+        hessian = numpy.empty((n, n))
+        for i in xrange(n):
+            up, down = vector.copy(), vector.copy()
+            up[i] += steps[i]
+            down[i] -= steps[i]
+            hessian[i,:] = (self._gradient(free, up) - self._gradient(free, down)) / (2. * steps[i])
+        hessian = 0.5 * (hessian + hessian.T)
+
+        self.fval = self._call(free, vector)
+        try:
+            self._set_covariance(free, 2. * self.up * numpy.linalg.inv(hessian))
+        except numpy.linalg.LinAlgError:
+            self._set_covariance(free, numpy.empty((n, n)) * float("nan"))
 
 def principleComponents(values):
     """Return the two largest-variance components of an orthogonal
@@ -5,6 +5,14 @@ import subprocess
 import codecs
 import numbers
 import base64, StringIO
+import gzip
+import collections
+import inspect
+import os
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
 
 ### maybe someday convert to cElementTree output rather than string concatenation
 # try:
@@ -13,6 +21,7 @@ import base64, StringIO
 #     import xml.etree.cElementTree as ElementTree
 
 # Special dependencies
+import numpy
 import PIL.Image # sudo apt-get install python-imaging
 
 # Cassius interdependencies
@@ -39,6 +48,10 @@ defaults = {
     "width": 1000,
     "height": 1000,
     "background": True,
+    "compress": None,
+    "compresslevel": 6,
+    "cache": False,
+    "processes": None,
     }
 
 #: Default values for frame arguments.
@@ -80,9 +93,70 @@ default_frameargs = {
     "ymargin": 0.1,
     }
 
+class _SVGStream:
+    """Takes the place of `SVG.body` when streaming: elements are
+    written to the sink in batches of `buffersize` as they are
+    appended."""
+
+    def __init__(self, sink, buffersize=1000):
+        self.sink, self.buffersize = sink, buffersize
+        self.buffer = []
+
+    def append(self, line):
+        self.buffer.append(line)
+        if len(self.buffer) >= self.buffersize:
+            self.flush()
+
+    def extend(self, lines):
+        for line in lines:
+            self.append(line)
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            self.buffer.append(u"")
+            self.sink.write(u"\n".join(self.buffer))
+            self.buffer = []
+
+class _SVGStreamDefs(dict):
+    """Takes the place of `SVG.defs` when streaming: each new
+    definition is written inline, in its own <defs> block, before the
+    elements that refer to it."""
+
+    def __init__(self, stream):
+        dict.__init__(self)
+        self.stream = stream
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self.stream.append(u"<defs>")
+            self.stream.append(value)
+            self.stream.append(u"</defs>")
+        # only the names are needed to recognize repeated definitions
+        dict.__setitem__(self, key, None)
+
 # represents an SVG document filled by drawing commands
 class SVG:
-    def __init__(self, width, height, background):
+    """An SVG document, filled by the drawing commands.
+
+    Arguments:
+       width, height (numbers): size of the image in pixels
+
+       background (bool): if True, fill the image with white
+
+       sink (file-like object or `None`): if `None`, collect the
+       document in memory for `write` or `tostring`; otherwise,
+       write it to `sink` as it is drawn and finish it with `close`
+
+       namespace (string): prefix for all names made by `uniquename`
+
+    Behavior:
+       When streaming, the header is written immediately, elements
+       are written in batches as they are drawn, and <defs> are
+       written inline, just before the elements that use them, so
+       the memory needed does not grow with the number of elements.
+    """
+
+    def __init__(self, width, height, background, sink=None, namespace=""):
         self.width, self.height = width, height
 
         self.header = """<?xml version="1.0" standalone="no"?>
@@ -92,8 +166,18 @@ class SVG:
         self.footer = "</svg>\n"
 
         self.names = {}
-        self.defs = {}
-        self.body = []
+        self.namespace = namespace
+        self.fragments = set()  # cached renderings already in this document
+        self.sink = sink
+        if sink is None:
+            self.defs = {}
+            self.body = []
+        else:
+            sink.write(self.header)
+            sink.write("<g id=\"whole_document\">\n")
+            self.body = _SVGStream(sink)
+            self.defs = _SVGStreamDefs(self.body)
+
         if background:
             self.body.append("""<rect id="background" x="0" y="0" width="%(width)g" height="%(height)g" stroke="none" fill="white" />""" % vars())
 
@@ -102,9 +186,24 @@ class SVG:
             self.names[base] = 0
         else:
             self.names[base] += 1
-        return "%s_%d" % (base, self.names[base])
+        return "%s%s_%d" % (self.namespace, base, self.names[base])
+
+    def close(self):
+        """Finish a streaming document (does not close the sink)."""
+
+        if self.sink is None:
+            raise RuntimeError, "This SVG is not streaming; use write(fileName) instead"
+
+        self.body.flush()
+        self.sink.write("</g>\n")
+        self.sink.write(self.footer)
+        if hasattr(self.sink, "flush"):
+            self.sink.flush()
 
     def write(self, fileName):
+        if self.sink is not None:
+            raise RuntimeError, "This SVG is streaming to its sink; use close() instead"
+
         if hasattr(fileName, "write"):
             f = fileName
         else:
@@ -130,6 +229,9 @@ class SVG:
         f.write(self.footer)
 
     def tostring(self):
+        if self.sink is not None:
+            raise RuntimeError, "This SVG is streaming to its sink; it has no string form"
+
         f = StringIO.StringIO()
         f.write(self.header)
         if len(self.defs) > 0:
@@ -142,6 +244,74 @@ class SVG:
         f.write(self.footer)
         return f.getvalue()
 
+###################################################### handlers for each class of drawable object
+
+# functions given to `register`: kind -> {class: function}
+_registry = {"draw": {}, "prehook": {}, "posthook": {}}
+
+# module-level functions found by naming convention, e.g. _draw_Histogram
+_conventions = {"draw": "_draw_%s", "prehook": "_frameargs_prehook_%s", "posthook": "_frameargs_posthook_%s"}
+
+# handlers resolved along the method resolution order: (kind, class) -> function or None
+_resolved = {}
+
+def register(cls, draw=None, prehook=None, posthook=None):
+    """Register functions to draw a new class of object.
+
+    Arguments:
+       cls (class): class of objects to draw; subclasses inherit
+       its handlers unless they have their own
+
+       draw (function or `None`): called as `draw(obj, **kwds)` to
+       add the object to `kwds["svg"]`
+
+       prehook (function or `None`): called as `prehook(obj, output,
+       **kwds)` to adjust the frame arguments `output` (a dict) before
+       defaults, ranges, and ticks are filled in; returns `output`
+
+       posthook (function or `None`): same as `prehook`, but called
+       after defaults, ranges, and ticks are filled in
+
+    Behavior:
+       Handlers that are not registered are found by name: a
+       function `_draw_ClassName`, `_frameargs_prehook_ClassName`,
+       or `_frameargs_posthook_ClassName` in this module.  For each
+       kind of handler, the first class in `cls`'s method resolution
+       order that has one (registered or by name) provides it.
+    """
+
+    for kind, function in ("draw", draw), ("prehook", prehook), ("posthook", posthook):
+        if function is not None:
+            _registry[kind][cls] = function
+    _resolved.clear()
+
+def _handler(kind, cls):
+    """Return the `kind` handler ("draw", "prehook", or "posthook")
+    for objects of class `cls`, or `None` if there is none."""
+
+    try:
+        return _resolved[kind, cls]
+    except KeyError:
+        pass
+
+    output = None
+    for c in inspect.getmro(cls):
+        if c in _registry[kind]:
+            output = _registry[kind][c]
+            break
+        output = globals().get(_conventions[kind] % c.__name__)
+        if output is not None:
+            break
+
+    _resolved[kind, cls] = output
+    return output
+
+def _drawhandler(cls):
+    subcommand = _handler("draw", cls)
+    if subcommand is None:
+        raise NotImplementedError, "A '_draw_%s' function has not been implemented in backends.svg (see svgdraw.register)" % cls.__name__
+    return subcommand
+
 # this is what the user calls
 def view(obj, **kwds):
     """Render a drawable object and put it in an interactive window.
@@ -160,10 +330,7 @@ def view(obj, **kwds):
     else:
         drawClass = obj.__class__
 
-    try:
-        subcommand = eval("_draw_%s" % drawClass.__name__)
-    except NameError:
-        raise NotImplementedError, "A '_draw_%s' function has not been implemented in backends.svg" % drawClass.__name__
+    subcommand = _drawhandler(drawClass)
 
     if svg is None:
         # set the defaults (if not already overridden with explicit keyword arguments)
@@ -176,27 +343,37 @@ def view(obj, **kwds):
         kwds["x1"], kwds["y1"], kwds["x2"], kwds["y2"] = 0., 0., float(kwds["width"]), float(kwds["height"])
 
         # run the command and view the SVG
-        subcommand(obj, **kwds)
+        _render(subcommand, obj, **kwds)
         _svgview.str(svg.tostring())
     else:
         # not working on a new SVG; add to the existing one
-        subcommand(obj, **kwds)
+        _render(subcommand, obj, **kwds)
 
 # this is what the user calls
 def draw(obj, **kwds):
     """Render a drawable object and save it to an SVG file.
 
-    Required keyword argument: fileName (string).  The fileName should
-    include an \".svg\" suffix.
+    Required keyword argument: fileName (string or file-like object).
+    The fileName should include an \".svg\" suffix, or \".svgz\" for
+    gzip-compressed SVG.
+
+    Optional keyword arguments: compress (bool or `None`) to force
+    (or prevent) gzip compression regardless of the suffix,
+    compresslevel (1-9) to trade speed for size, cache (bool) to
+    reuse the SVG of objects (and sub-plots of a Layout or Overlay)
+    that have not changed since they were last drawn with the same
+    arguments (renderings too large for the cache are streamed as
+    usual and not kept), and processes (int or `None`) to draw the panels of a
+    Layout in that many worker processes.
+
+    The SVG is written to the file as it is drawn, rather than being
+    assembled in memory first.
     """
 
     svg = kwds.get("svg", None)
     
     # actual drawing is done in internal subcommands
-    try:
-        subcommand = eval("_draw_%s" % obj.__class__.__name__)
-    except NameError:
-        raise NotImplementedError, "A '_draw_%s' function has not been implemented in backends.svg" % obj.__class__.__name__
+    subcommand = _drawhandler(obj.__class__)
 
     if svg is None:
         try:
@@ -208,17 +385,41 @@ def draw(obj, **kwds):
         for arg, value in defaults.items():
             if arg not in kwds:
                 kwds[arg] = value
+        compress = kwds["compress"]
+        if compress is None:
+            compress = isinstance(fileName, basestring) and fileName.lower().endswith(".svgz")
+
+        if hasattr(fileName, "write"):
+            stream = fileName
+        else:
+            stream = open(fileName, "wb")
+        if compress:
+            compressed = gzip.GzipFile(fileobj=stream, mode="wb", compresslevel=kwds["compresslevel"])
+            sink = codecs.getwriter("utf-8")(compressed)
+        elif stream is fileName:
+            compressed = None
+            sink = stream
+        else:
+            compressed = None
+            sink = codecs.getwriter("utf-8")(stream)
+
         # the following are derived arguments
-        svg = SVG(kwds["width"], kwds["height"], kwds["background"])
+        svg = SVG(kwds["width"], kwds["height"], kwds["background"], sink)
         kwds["svg"] = svg
         kwds["x1"], kwds["y1"], kwds["x2"], kwds["y2"] = 0., 0., float(kwds["width"]), float(kwds["height"])
 
-        # run the command and write the SVG
-        subcommand(obj, **kwds)
-        svg.write(fileName)
+        # run the command, streaming the SVG to the file
+        try:
+            _render(subcommand, obj, **kwds)
+            svg.close()
+        finally:
+            if compressed is not None:
+                compressed.close()
+            if stream is not fileName:
+                stream.close()
     else:
         # not working on a new SVG; add to the existing one
-        subcommand(obj, **kwds)
+        _render(subcommand, obj, **kwds)
 
 # this draws a PDF by invoking inkscape on an intermediary SVG file
 def drawpdf(obj, fileName, tmpFileName="/tmp/tmp.svg", **kwds):
@@ -233,6 +434,253 @@ def drawpdf(obj, fileName, tmpFileName="/tmp/tmp.svg", **kwds):
     proc = subprocess.Popen(["inkscape", tmpFileName, "--export-pdf=" + fileName])
     proc.wait()
 
+###################################################### caching rendered SVG
+
+# cached renderings: key -> (serial number, body lines, defs, serial numbers of all fragments included, size)
+_rendercache = collections.OrderedDict()
+_rendercachesize = 256                  # most renderings kept
+_rendercachelimit = 16 * 1024**2        # most characters kept, in all renderings
+_rendercacheentrylimit = 1024**2        # renderings bigger than this are not kept
+_rendercachetotal = 0
+_rendercacheserial = 0
+
+# keyword arguments that do not affect the SVG of an object
+_rendercache_ignore = ("svg", "fileName", "cache", "compress", "compresslevel", "processes")
+
+def _cachekey(value):
+    """Convert drawable objects and keyword arguments into a hashable
+    key; raises TypeError if this is not possible."""
+
+    if isinstance(value, containers.Frame):
+        # contents are represented by the version; plots and legend fields may be changed in place
+        return (value.__class__, id(value), value._version, _cachekey(value.__dict__.get("plots")), _cachekey(value.__dict__.get("fields")))
+    elif isinstance(value, containers.Layout):
+        return (value.__class__, id(value), value.nrows, value.ncols, value.sharex, value.sharey, _cachekey(value.plots))
+    elif isinstance(value, containers.Style):
+        return (value.__class__, _cachekey(value.__dict__))
+    elif isinstance(value, dict):
+        return (dict,) + tuple(sorted([(k, _cachekey(v)) for k, v in value.items()]))
+    elif isinstance(value, (list, tuple)):
+        return (value.__class__,) + tuple(map(_cachekey, value))
+    elif isinstance(value, numpy.ndarray):
+        return (numpy.ndarray, value.shape, value.dtype.str, value.tostring())
+    else:
+        hash(value)
+        return value
+
+def _rendercachekey(obj, kwds):
+    """Return the cache key for drawing `obj` with `kwds`, or `None`
+    if the cache is off or the arguments can't be made into a key."""
+
+    if not kwds.get("cache", False):
+        return None
+    try:
+        return (_cachekey(obj), _cachekey(dict([(k, v) for k, v in kwds.items() if k not in _rendercache_ignore])), _cachekey(default_frameargs))
+    except TypeError:
+        return None
+
+class _FragmentBody(list):
+    """Takes the place of `SVG.body` in a fragment drawn for the
+    cache: lines are collected until the fragment grows past
+    `_rendercacheentrylimit` characters, then it and everything
+    drawn after it go to the `target` SVG instead, so a rendering
+    too big to cache is drawn (or streamed) as if there were no
+    cache."""
+
+    def __init__(self, fragment, target):
+        list.__init__(self)
+        self.fragment, self.target = fragment, target
+        self.size = 0
+        self.spilled = False
+
+    def grow(self, size):
+        self.size += size
+        if not self.spilled and self.size > _rendercacheentrylimit:
+            self.spilled = True
+            for name, definition in dict.items(self.fragment.defs):
+                self.target.defs[name] = definition
+            self.target.body.extend(self)
+            del self[:]
+
+    def append(self, line):
+        if self.spilled:
+            self.target.body.append(line)
+        else:
+            list.append(self, line)
+            self.grow(len(line))
+
+    def extend(self, lines):
+        for line in lines:
+            self.append(line)
+
+class _FragmentDefs(dict):
+    """Takes the place of `SVG.defs` in a fragment drawn for the
+    cache, counting toward (and following) its `_FragmentBody`."""
+
+    def __init__(self, body):
+        dict.__init__(self)
+        self.body = body
+
+    def __setitem__(self, name, definition):
+        if self.body.spilled:
+            self.body.target.defs[name] = definition
+        else:
+            new = name not in self
+            dict.__setitem__(self, name, definition)
+            if new:
+                self.body.grow(len(definition))
+
+def _fragment(width, height, serial=None, target=None):
+    """Make an empty SVG to draw into, with names that can't clash
+    with any other fragment's; returns a serial number and the SVG.
+
+    If a `target` SVG is given, the fragment's contents go to it
+    instead once they are too big to cache."""
+
+    global _rendercacheserial
+    if serial is None:
+        _rendercacheserial += 1
+        serial = _rendercacheserial
+    fragment = SVG(width, height, False, namespace="r%d_" % serial)
+    if target is not None:
+        fragment.body = _FragmentBody(fragment, target)
+        fragment.defs = _FragmentDefs(fragment.body)
+    return serial, fragment
+
+def _entry(serial, body, defs, fragments):
+    """Make a cache entry, including its size in characters."""
+
+    size = sum(map(len, body)) + sum([len(definition) for name, definition in defs])
+    return serial, body, defs, fragments, size
+
+def _cacheget(key):
+    """Remove and return the cached rendering for `key`, or `None`."""
+
+    global _rendercachetotal
+    entry = _rendercache.pop(key, None)
+    if entry is not None:
+        _rendercachetotal -= entry[4]
+    return entry
+
+def _cacheput(key, entry):
+    """Cache a rendering as the most recently used, unless it is too
+    big, and drop the least recently used beyond the limits."""
+
+    global _rendercachetotal
+    _cacheget(key)
+    if entry[4] > _rendercacheentrylimit:
+        return
+    _rendercache[key] = entry
+    _rendercachetotal += entry[4]
+    while len(_rendercache) > _rendercachesize or _rendercachetotal > _rendercachelimit:
+        _rendercachetotal -= _rendercache.popitem(last=False)[1][4]
+
+def _paste(svg, key, entry):
+    """Copy a rendered fragment into `svg` (and the cache, if `key` is not `None`)."""
+
+    if key is not None:
+        _cacheput(key, entry)
+
+    serial, body, defs, fragments, size = entry
+    for name, definition in defs:
+        svg.defs[name] = definition
+    svg.body.extend(body)
+    svg.fragments.update(fragments)
+
+def _render(subcommand, obj, **kwds):
+    """Run a drawing subcommand, reusing the SVG from a previous call
+    with the same object contents and arguments if the cache is on.
+
+    Only renderings up to `_rendercacheentrylimit` characters are
+    kept, and no more than `_rendercachelimit` characters in all, so
+    the cache does not hold on to large plots that are streamed."""
+
+    svg = kwds["svg"]
+    key = _rendercachekey(obj, kwds)
+    if key is None:
+        subcommand(obj, **kwds)
+        return
+
+    entry = _cacheget(key)
+    if entry is None:
+        # draw into a separate document, so that it can be copied into any other
+        serial, fragment = _fragment(svg.width, svg.height, target=svg)
+        kwds["svg"] = fragment
+        subcommand(obj, **kwds)
+        if fragment.body.spilled:
+            # already drawn into svg; too big to keep
+            svg.fragments.update(fragment.fragments)
+            return
+        entry = _entry(serial, list(fragment.body), dict.items(fragment.defs), frozenset(fragment.fragments | set([serial])))
+    elif entry[0] in svg.fragments:
+        # the same rendering twice in one document would repeat its names
+        _cacheput(key, entry)
+        subcommand(obj, **kwds)
+        return
+
+    _paste(svg, key, entry)
+
+###################################################### drawing Layout panels in parallel
+
+# set in the parent just before the worker processes are forked: list of (plot, kwds, serial)
+_parallel_cells = None
+
+def _draw_cell(index):
+    """Draw one Layout panel in a worker process and return its body lines and defs."""
+
+    plot, kwds, serial = _parallel_cells[index]
+    serial, fragment = _fragment(kwds["svg"].width, kwds["svg"].height, serial)
+    kwds = dict(kwds)
+    kwds["svg"] = fragment
+    kwds["cache"] = False      # a worker's cache (and its fragment names) would be lost
+    kwds["processes"] = None   # nested Layouts are drawn serially
+    draw(plot, **kwds)
+    return fragment.body, fragment.defs.items()
+
+def _draw_parallel(cells, **kwds):
+    """Draw a list of (plot, kwds) Layout panels, each in a worker
+    process, and paste them into the SVG in order."""
+
+    global _parallel_cells, _rendercacheserial
+    svg, processes = kwds["svg"], kwds["processes"]
+
+    # panels with cached renderings don't need to be drawn again
+    keys, entries, todo = [], [], []
+    for index, (plot, k) in enumerate(cells):
+        key = _rendercachekey(plot, k)
+        entry = None
+        if key is not None:
+            entry = _rendercache.get(key)
+            if entry is not None and entry[0] in svg.fragments:
+                entry, key = None, None
+        if entry is None:
+            _rendercacheserial += 1
+            todo.append((plot, k, _rendercacheserial))
+        keys.append(key)
+        entries.append(entry)
+
+    if len(todo) > 0:
+        _parallel_cells = todo
+        pool = multiprocessing.Pool(min(processes, len(todo)))
+        try:
+            results = pool.map(_draw_cell, range(len(todo)), chunksize=1)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _parallel_cells = None
+
+        finished = iter(zip(todo, results))
+        for index in xrange(len(entries)):
+            if entries[index] is None:
+                (plot, k, serial), (body, defs) = finished.next()
+                entries[index] = _entry(serial, body, defs, frozenset([serial]))
+
+    for key, entry in zip(keys, entries):
+        _paste(svg, key, entry)
+
 ###################################################### utilities
 
 def _svgopacity(obj):
@@ -275,27 +723,91 @@ def _svglinewidth(obj):
 def _svgmarkersize(obj):
     return obj*7.5
 
-def _transformX(x, wx1, wx2, xmin, xmax, xlog):
-    if xlog:
-        return wx1 + (math.log10(x) - math.log10(xmin))*(wx2 - wx1)/(math.log10(xmax) - math.log10(xmin))
-    else:
-        return wx1 + (x - xmin)*(wx2 - wx1)/(xmax - xmin)
+class Transform:
+    """Converts data coordinates into SVG coordinates for one frame.
 
-def _transformY(y, wy1, wy2, ymin, ymax, ylog):
-    if ylog:
-        return wy2 - (math.log10(y) - math.log10(ymin))*(wy2 - wy1)/(math.log10(ymax) - math.log10(ymin))
-    else:
-        return wy2 - (y - ymin)*(wy2 - wy1)/(ymax - ymin)
+    Arguments:
+       wx1, wy1, wx2, wy2 (numbers): the frame's window in SVG
+       coordinates
+
+       xmin, ymin, xmax, ymax (numbers): the data range shown in the
+       window
+
+       xlog, ylog (bool): logarithmic axes
+
+    Behavior:
+       The scale of each axis (and the logarithms of the range, for
+       logarithmic axes) is computed once, when the Transform is made.
+
+       `x` and `y` convert numbers with `math` or arrays with `numpy`;
+       calling the Transform with (x, y) converts a point and `apply`
+       converts arrays of points.
+    """
+
+    def __init__(self, wx1, wy1, wx2, wy2, xmin, ymin, xmax, ymax, xlog, ylog):
+        self.wx1, self.wy2 = wx1, wy2
+        self.xlog, self.ylog = xlog, ylog
+
+        if xlog:
+            xmin, xmax = math.log10(xmin), math.log10(xmax)
+        self.xorigin, self.xscale = xmin, (wx2 - wx1)/(xmax - xmin)
+
+        if ylog:
+            ymin, ymax = math.log10(ymin), math.log10(ymax)
+        self.yorigin, self.yscale = ymin, (wy2 - wy1)/(ymax - ymin)
+
+    def __repr__(self):
+        return "<Transform x*%g%s y*%g%s>" % (self.xscale, " log" if self.xlog else "", self.yscale, " log" if self.ylog else "")
+
+    def x(self, x):
+        if self.xlog:
+            if isinstance(x, numpy.ndarray):
+                # non-positive values become -inf or nan, which _svgbulk leaves out
+                with numpy.errstate(divide="ignore", invalid="ignore"):
+                    x = numpy.log10(x)
+            else: x = math.log10(x)
+        return self.wx1 + (x - self.xorigin)*self.xscale
+
+    def y(self, y):
+        if self.ylog:
+            if isinstance(y, numpy.ndarray):
+                # non-positive values become -inf or nan, which _svgbulk leaves out
+                with numpy.errstate(divide="ignore", invalid="ignore"):
+                    y = numpy.log10(y)
+            else: y = math.log10(y)
+        return self.wy2 - (y - self.yorigin)*self.yscale
+
+    def __call__(self, x, y):
+        return self.x(x), self.y(y)
+
+    def apply(self, xs, ys):
+        """Convert arrays (or sequences) of x and y into arrays of SVG coordinates."""
+        return self.x(numpy.asarray(xs, dtype=numpy.float)), self.y(numpy.asarray(ys, dtype=numpy.float))
+
+def _svgbulk(template, columns, chunksize=10000):
+    """Format `template` once for each row of `columns` (equal-length
+    arrays), yielding strings of up to `chunksize` rows each.
+
+    Rows with an infinite or NaN value (such as a point at or below
+    zero on a logarithmic axis) can't be drawn and are left out."""
+
+    table = numpy.column_stack(columns)
+    finite = numpy.isfinite(table).all(axis=1)
+    if not finite.all():
+        table = table[finite]
+    for start in xrange(0, len(table), chunksize):
+        chunk = table[start:start+chunksize]
+        yield (template * len(chunk)) % tuple(chunk.ravel().tolist())
 
 ###################################################### draw_frame
 
-def _get_frameargs(obj, **kwds):
+def _get_framelimits(obj, **kwds):
+    """Frame arguments with the prehook, defaults, and data-space
+    limits applied, but not the ticks or posthook."""
+
     output = obj._frameargs()
 
-    try:
-        subcommand = eval("_frameargs_prehook_%s" % obj.__class__.__name__)
-    except NameError:
-        subcommand = None
+    subcommand = _handler("prehook", obj.__class__)
     if subcommand is not None:
         output = subcommand(obj, output, **kwds)
 
@@ -337,6 +849,11 @@ def _get_frameargs(obj, **kwds):
         if output["xmax"] is containers.Auto: output["xmax"] = xmax
         if output["ymax"] is containers.Auto: output["ymax"] = ymax
 
+    return output
+
+def _get_frameargs(obj, **kwds):
+    output = _get_framelimits(obj, **kwds)
+
     if output["xticks"] is None:
         output["xticks"] = {}
     elif callable(output["xticks"]):
@@ -397,10 +914,7 @@ def _get_frameargs(obj, **kwds):
         if output["show_rightticklabels"] is containers.Auto:
             output["show_rightticklabels"] = True
 
-    try:
-        subcommand = eval("_frameargs_posthook_%s" % obj.__class__.__name__)
-    except NameError:
-        subcommand = None
+    subcommand = _handler("posthook", obj.__class__)
     if subcommand is not None:
         output = subcommand(obj, output, **kwds)
 
@@ -412,6 +926,11 @@ def _get_window(**kwds):
     wy1, wy2 = y1 + f["topmargin"]*(y2 - y1), y2 - f["bottommargin"]*(y2 - y1)
     return wx1, wy1, wx2, wy2
 
+def _get_transform(**kwds):
+    f = kwds["frameargs"]
+    wx1, wy1, wx2, wy2 = _get_window(**kwds)
+    return Transform(wx1, wy1, wx2, wy2, f["xmin"], f["ymin"], f["xmax"], f["ymax"], f["xlog"], f["ylog"])
+
 def _draw_frame(**kwds):
     svg, x1, y1, x2, y2 = kwds["svg"], kwds["x1"], kwds["y1"], kwds["x2"], kwds["y2"]
     f = kwds["frameargs"]
@@ -420,8 +939,7 @@ def _draw_frame(**kwds):
     windowwidth, windowheight = wx2 - wx1, wy2 - wy1
     font_size = f["textscale"]*30.
 
-    xmin, ymin, xmax, ymax = f["xmin"], f["ymin"], f["xmax"], f["ymax"]
-    xlog, ylog = f["xlog"], f["ylog"]
+    t = _get_transform(**kwds)
 
     framename = svg.uniquename("frame")
     svg.body.append(u"""<g id="%(framename)s">""" % vars())
@@ -435,7 +953,7 @@ def _draw_frame(**kwds):
     svg.body.append(u"""    <g id="%(framename)s_bottomticks">""" % vars())
     tickend, minitickend, textmid = wy2 - 20., wy2 - 10., wy2 + 30.
     for x, label in f["xticks"].items():
-        hpos = _transformX(x, wx1, wx2, xmin, xmax, xlog)
+        hpos = t.x(x)
         if label is not None:
             svg.body.append(u"""        <path d="M %(hpos)g %(wy2)g L %(hpos)g %(tickend)g" />""" % vars())
             svg.body.append(u"""        <text font-size="%(font_size)g" transform="translate(%(hpos)g, %(textmid)g)" text-anchor="middle" dominant-baseline="middle" stroke="none" fill="black">%(label)s</text>""" % vars())
@@ -452,7 +970,7 @@ def _draw_frame(**kwds):
     svg.body.append(u"""    <g id="%(framename)s_leftticks">""" % vars())
     tickend, minitickend, textmid = wx1 + 20., wx1 + 10., wx1 - 10.
     for y, label in f["yticks"].items():
-        vpos = _transformY(y, wy1, wy2, ymin, ymax, ylog)
+        vpos = t.y(y)
         vpostext = vpos + 10.
         if label is not None:
             svg.body.append(u"""        <path d="M %(wx1)g %(vpos)g L %(tickend)g %(vpos)g" />""" % vars())
@@ -470,7 +988,7 @@ def _draw_frame(**kwds):
     svg.body.append(u"""    <g id="%(framename)s_topticks">""" % vars())
     tickend, minitickend, textmid = wy1 + 20., wy1 + 10., wy1 - 30.
     for x, label in f["topticks"].items():
-        hpos = _transformX(x, wx1, wx2, xmin, xmax, xlog)
+        hpos = t.x(x)
         if label is not None:
             svg.body.append(u"""        <path d="M %(hpos)g %(wy1)g L %(hpos)g %(tickend)g" />""" % vars())
             if f["show_topticklabels"]:
@@ -488,7 +1006,7 @@ def _draw_frame(**kwds):
     svg.body.append(u"""    <g id="%(framename)s_rightticks">""" % vars())
     tickend, minitickend, textmid = wx2 - 20., wx2 - 10., wx2 + 10.
     for y, label in f["rightticks"].items():
-        vpos = _transformY(y, wy1, wy2, ymin, ymax, ylog)
+        vpos = t.y(y)
         vpostext = vpos + 10.
         if label is not None:
             svg.body.append(u"""        <path d="M %(wx2)g %(vpos)g L %(tickend)g %(vpos)g" />""" % vars())
@@ -520,34 +1038,82 @@ def _draw_Layout(obj, **kwds):
     #       by passing down a multiplier?
     width = (x2 - x1)/float(obj.ncols)
     height = (y2 - y1)/float(obj.nrows)
+    cells = []
     for i in xrange(obj.nrows):
-        kwds["y1"], kwds["y2"] = (y1 + i*height), (y1 + (i+1)*height)
         for j in xrange(obj.ncols):
-            kwds["x1"], kwds["x2"] = (x1 + j*width), (x1 + (j+1)*width)
-            draw(obj[i,j], **kwds)
+            k = dict(kwds)
+            k["x1"], k["y1"], k["x2"], k["y2"] = (x1 + j*width), (y1 + i*height), (x1 + (j+1)*width), (y1 + (i+1)*height)
+            cells.append((obj[i,j], k))
+    _share_limits(obj, cells)
+
+    processes = kwds.get("processes", None)
+    if processes is not None and processes > 1 and len(cells) > 1 and multiprocessing is not None and hasattr(os, "fork"):
+        # workers are forked, so they see the panels without pickling them
+        _draw_parallel(cells, **kwds)
+    else:
+        for plot, k in cells:
+            draw(plot, **k)
 
-def _draw_Overlay(obj, **kwds):
-    svg, x1, y1, x2, y2 = kwds["svg"], kwds["x1"], kwds["y1"], kwds["x2"], kwds["y2"]
+def _frameobject(obj):
+    """Find the object that sets the coordinate frame of an Overlay or Stack."""
 
-    drawframe = kwds.get("drawframe", True)
+    if isinstance(obj, containers.Stack):
+        obj._prepare()
+        return _frameobject(obj._overlay)
 
-    def findframe(obj):
-        if isinstance(obj, containers.Stack):
-            obj._prepare()
-            return findframe(obj._overlay)
+    elif isinstance(obj, containers.Overlay):
+        if "frame" in obj.__dict__ and obj.frame is not None:
+            if obj.frame >= len(obj.plots):
+                raise containers.ContainerException, "Overlay.frame points to a non-existent plot (%d <= %d)" % (obj.frame, len(obj.plots))
+            return _frameobject(obj.plots[obj.frame])
+        else:
+            return obj
 
-        elif isinstance(obj, containers.Overlay):
-            if "frame" in obj.__dict__ and obj.frame is not None:
-                if obj.frame >= len(obj.plots):
-                    raise containers.ContainerException, "Overlay.frame points to a non-existent plot (%d <= %d)" % (obj.frame, len(obj.plots))
-                return findframe(obj.plots[obj.frame])
-            else:
-                return _get_frameargs(obj, **kwds)
+    else:
+        return obj
 
-        else:
-            return _get_frameargs(obj, **kwds)
+def _share_limits(obj, cells):
+    """Fix the data-space limits of all Layout panels in `cells` (a
+    list of (plot, kwds)), shared according to `obj.sharex` and
+    `obj.sharey`, so that each panel's data are scanned only once."""
+
+    sharex, sharey = getattr(obj, "sharex", False), getattr(obj, "sharey", False)
+    if not sharex and not sharey:
+        return
+
+    limits = {}
+    for index, (plot, k) in enumerate(cells):
+        if plot is not None and not isinstance(plot, (containers.Layout, containers.Legend)):
+            f = _get_framelimits(_frameobject(plot), **k)
+            limits[index] = [f["xmin"], f["ymin"], f["xmax"], f["ymax"]]
+
+    def share(low, high, group):
+        groups = {}
+        for index in limits:
+            groups.setdefault(group(index), []).append(index)
+        for members in groups.values():
+            lowest = min([limits[index][low] for index in members])
+            highest = max([limits[index][high] for index in members])
+            for index in members:
+                limits[index][low], limits[index][high] = lowest, highest
+
+    # True shares an axis among all panels, "col" ("row") among the panels in each column (row)
+    if sharex:
+        share(0, 2, lambda index: (index % obj.ncols if sharex == "col" else None))
+    if sharey:
+        share(1, 3, lambda index: (index // obj.ncols if sharey == "row" else None))
+
+    # explicit limits on both axes also keep the panels from calling ranges() again
+    for index, (xmin, ymin, xmax, ymax) in limits.items():
+        k = cells[index][1]
+        k["xmin"], k["ymin"], k["xmax"], k["ymax"] = xmin, ymin, xmax, ymax
+
+def _draw_Overlay(obj, **kwds):
+    svg, x1, y1, x2, y2 = kwds["svg"], kwds["x1"], kwds["y1"], kwds["x2"], kwds["y2"]
+
+    drawframe = kwds.get("drawframe", True)
 
-    foundframe = findframe(obj)  # to evaluate all Stacks
+    foundframe = _get_frameargs(_frameobject(obj), **kwds)  # to evaluate all Stacks
     if drawframe:
         kwds["frameargs"] = foundframe
         kwds["drawframe"] = False  # for the contained objects
@@ -603,6 +1169,59 @@ def _frameargs_prehook_HistogramCategorical(obj, output, **kwds):
 def _draw_HistogramAbstract(obj, **kwds):
     _draw_Histogram(obj, **kwds)
 
+def _collapse_subpixel_bins(lows, highs, heights, discontinuous, y0):
+    """Replace runs of bins that start in the same pixel column by
+    their min/max envelope, so that the outline has at most a few
+    vertices per pixel.  All arguments are in SVG coordinates."""
+
+    column = numpy.floor(lows)
+    newcolumn = numpy.ones(len(lows), dtype=numpy.bool)
+    newcolumn[1:] = column[1:] != column[:-1]
+    if numpy.all(newcolumn):
+        return lows, highs, heights, discontinuous
+
+    starts = numpy.flatnonzero(newcolumn)
+    ends = numpy.append(starts[1:], len(lows)) - 1
+    top = numpy.minimum.reduceat(heights, starts)
+    bottom = numpy.maximum.reduceat(heights, starts)
+    # a gap between bins within the column reaches down to zero
+    inner = numpy.add.reduceat(discontinuous.astype(numpy.int), starts) - discontinuous[starts]
+    bottom = numpy.where(inner > 0, numpy.maximum(bottom, y0), bottom)
+
+    # each multi-bin column becomes a zero-width bin at its bottom and a full-width bin at its top
+    counts = numpy.where(ends > starts, 2, 1)
+    group = numpy.repeat(numpy.arange(len(starts)), counts)
+    first = numpy.arange(len(group)) == numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    single = (counts == 1)[group]
+
+    newlows = lows[starts][group]
+    newhighs = numpy.where(first & ~single, newlows, highs[ends][group])
+    newheights = numpy.where(first, bottom[group], top[group])
+    newdiscontinuous = first & discontinuous[starts][group]
+    return newlows, newhighs, newheights, newdiscontinuous
+
+def _histogram_outline(lows, highs, heights, discontinuous, y0, gap):
+    """Return SVG path data for the step outline of bins (in SVG
+    coordinates), dropping to `y0` at discontinuities and, if `gap` is
+    nonzero, between every pair of bins."""
+
+    if len(lows) == 0:
+        return ""
+
+    # each bin contributes up to four vertices: (low, 0), (low, height), (high, height), (high, 0)
+    halfgap = gap/2. if gap > mathtools.epsilon else 0.
+    xs = numpy.column_stack((lows + halfgap, lows + halfgap, highs - halfgap, highs - halfgap))
+    ys = numpy.column_stack((numpy.zeros(len(heights)) + y0, heights, heights, numpy.zeros(len(heights)) + y0))
+    keep = numpy.ones(xs.shape, dtype=numpy.bool)
+    if halfgap == 0.:
+        keep[:,0] = discontinuous
+        keep[:-1,3] = discontinuous[1:]
+        keep[-1,3] = False
+
+    xs = numpy.append(xs[keep], highs[-1])
+    ys = numpy.append(ys[keep], y0)
+    return ("M %g %g" % (lows[0], y0)) + "".join(_svgbulk(" L %g %g", (xs, ys)))
+
 def _draw_Histogram(obj, **kwds):
     svg = kwds["svg"]
     if kwds.get("drawframe", True): kwds["frameargs"] = _get_frameargs(obj, **kwds)
@@ -618,67 +1237,24 @@ def _draw_Histogram(obj, **kwds):
     wx1, wy1, wx2, wy2 = _get_window(**kwds)
     windowwidth, windowheight = wx2 - wx1, wy2 - wy1
     xmin, ymin, xmax, ymax, xlog, ylog = f["xmin"], f["ymin"], f["xmax"], f["ymax"], f["xlog"], f["ylog"]
-    def t(x, y):
-        return _transformX(x, wx1, wx2, xmin, xmax, xlog), _transformY(y, wy1, wy2, ymin, ymax, ylog)
+    t = _get_transform(**kwds)
 
     xepsilon = mathtools.epsilon * (xmax - xmin)
-    yepsilon = mathtools.epsilon * (ymax - ymin)
-
-    bins = obj.binedges()
-    gap = obj.gap*(_transformX(xmax, wx1, wx2, xmin, xmax, xlog) - _transformX(xmin, wx1, wx2, xmin, xmax, xlog))/len(obj.bins)
-
-    line = [] # in data coordinates
-    pathdata = [] # in SVG coordinates with gaps
-    for (binlow, binhigh), value in zip(bins, obj.values):
-        if len(line) == 0:
-            line.append((binlow, 0.))
-            pathdata.append("M %g %g" % t(*line[-1]))
-
-            if gap > mathtools.epsilon:
-                line.append((binlow, 0.))
-                x, y = t(*line[-1])
-                x += gap/2.
-                pathdata.append("L %g %g" % (x, y))
 
-        elif abs(line[-1][0] - binlow) > xepsilon or gap > mathtools.epsilon:
-            line.append((line[-1][0], 0.))
-            line.append((binlow, 0.))
+    edges = numpy.array(obj.binedges(), dtype=numpy.float).reshape(-1, 2)
+    values = numpy.array(obj.values, dtype=numpy.float)
+    gap = obj.gap*(t.x(xmax) - t.x(xmin))/len(obj.bins)
 
-            if gap > mathtools.epsilon:
-                x, y = t(*line[-2])
-                x -= gap/2.
-                pathdata.append("L %g %g" % (x, y))
-                x, y = t(*line[-1])
-                x += gap/2.
-                pathdata.append("L %g %g" % (x, y))
-            else:
-                pathdata.append("L %g %g" % t(*line[-2]))
-                pathdata.append("L %g %g" % t(*line[-1]))
-
-        line.append((binlow, value))
-        line.append((binhigh, value))
-
-        if gap > mathtools.epsilon:
-            x, y = t(*line[-2])
-            x += gap/2.
-            pathdata.append("L %g %g" % (x, y))
-            x, y = t(*line[-1])
-            x -= gap/2.
-            pathdata.append("L %g %g" % (x, y))
-        else:
-            pathdata.append("L %g %g" % t(*line[-2]))
-            pathdata.append("L %g %g" % t(*line[-1]))
+    # bins that don't meet the previous bin drop to zero between them
+    discontinuous = numpy.zeros(len(values), dtype=numpy.bool)
+    discontinuous[1:] = abs(edges[:-1,1] - edges[1:,0]) > xepsilon
 
-    if gap > mathtools.epsilon:
-        line.append((line[-1][0], 0.))
-        x, y = t(*line[-1])
-        x -= gap/2.
-        pathdata.append("L %g %g" % (x, y))
+    y0 = t.y(0.)
+    lows, highs, heights = t.x(edges[:,0]), t.x(edges[:,1]), t.y(values)
+    if gap <= mathtools.epsilon:
+        lows, highs, heights, discontinuous = _collapse_subpixel_bins(lows, highs, heights, discontinuous, y0)
 
-    line.append((line[-1][0], 0.))
-    pathdata.append("L %g %g" % t(*line[-1]))
-
-    pathdata = " ".join(pathdata)
+    pathdata = _histogram_outline(lows, highs, heights, discontinuous, y0, gap)
 
     plotname = svg.uniquename(obj.__class__.__name__)
     plotclipname = "%s_clip" % plotname
@@ -710,15 +1286,17 @@ def _frameargs_prehook_TimeHist(obj, output, **kwds):
     if "xmax" in output and output["xmax"] is not None and output["xmax"] is not containers.Auto and isinstance(output["xmax"], basestring):
         output["xmax"] = obj.fromtimestring(output["xmax"])
 
+    if output.get("xticks", containers.Auto) is containers.Auto:
+        output["xticks"] = obj.calendarticks()
+
     return output
 
 def _frameargs_posthook_TimeHist(obj, output, **kwds):
-    f = obj._frameargs()
-    if "xticks" not in f or f["xticks"] is containers.Auto:
-        xticks = output["xticks"]
-        for value, name in xticks.items():
-            if name is not None:
-                xticks[value] = obj.totimestring(value)
+    # only if draw(..., xticks=Auto) overrode the calendar ticks set in the prehook
+    if kwds.get("xticks", None) is containers.Auto:
+        xticks = dict(output["xticks"])
+        values = [value for value, name in xticks.items() if name is not None]
+        xticks.update(zip(values, obj.totimestring(values)))
         output["xticks"] = xticks
     return output
 
@@ -757,6 +1335,26 @@ def _makemarker(shape, markersize, plotmarkname, markeroutline, markeroutlineopa
     else:
         return None
     
+def _markerpath(shape, markersize):
+    # the same shapes as _makemarker, as path data relative to an "M %g %g" at the marker's center
+    if shape == "circle":
+        r = markersize
+        return "M%%g %%gm%g 0a%g %g 0 1 0 %g 0a%g %g 0 1 0 %g 0z" % (-r, r, r, 2.*r, r, r, -2.*r)
+    elif shape == "square":
+        h = markersize
+        return "M%%g %%gm%g %gh%gv%gh%gz" % (-h, -h, 2.*h, 2.*h, -2.*h)
+    elif shape == "diamond":
+        h = math.sqrt(2.)*markersize
+        return "M%%g %%gm%g 0l%g %gl%g %gl%g %gz" % (-h, h, -h, h, h, -h, h)
+    elif shape == "plus":
+        h = markersize
+        return "M%%g %%gm%g 0h%gm%g %gv%g" % (-h, 2.*h, -h, -h, 2.*h)
+    elif shape == "times":
+        h = markersize/math.sqrt(2.)
+        return "M%%g %%gm%g %gl%g %gm0 %gl%g %g" % (-h, -h, 2.*h, 2.*h, -2.*h, -2.*h, 2.*h)
+    else:
+        return None
+
 def _draw_Scatter(obj, **kwds):
     svg = kwds["svg"]
     if kwds.get("drawframe", True): kwds["frameargs"] = _get_frameargs(obj, **kwds)
@@ -767,8 +1365,6 @@ def _draw_Scatter(obj, **kwds):
     wx1, wy1, wx2, wy2 = _get_window(**kwds)
     windowwidth, windowheight = wx2 - wx1, wy2 - wy1
     xmin, ymin, xmax, ymax, xlog, ylog = f["xmin"], f["ymin"], f["xmax"], f["ymax"], f["xlog"], f["ylog"]
-    def t(x, y):
-        return _transformX(x, wx1, wx2, xmin, xmax, xlog), _transformY(y, wy1, wy2, ymin, ymax, ylog)
 
     plotname = svg.uniquename(obj.__class__.__name__)
     plotclipname = "%s_clip" % plotname
@@ -787,82 +1383,95 @@ def _draw_Scatter(obj, **kwds):
     if theMarker is not None:
         svg.defs[plotmarkname] = theMarker
 
+    # too many points to draw individually: draw a raster of counts instead of markers and error bars
+    density = (getattr(obj, "density", None) is not None and obj.marker is not None and len(obj._limited_values) > obj.densitythreshold)
+    if density:
+        densitykwds = dict(kwds)
+        densitykwds["drawframe"] = False
+        densitykwds["frameargs"] = f
+        _draw_ColorField(obj._densityfield(xmin, ymin, xmax, ymax, xlog, ylog, windowwidth, windowheight), **densitykwds)
+
     h = "#"
     svg.body.append(u"""<g id="%(plotname)s" clip-path="url(%(h)s%(plotclipname)s)">""" % vars())
 
     xindex = obj.index()["x"]
     yindex = obj.index()["y"]
 
+    # all coordinates are transformed at once and written in bulk
+    t = _get_transform(**kwds)
+    tx, ty = t.x, t.y
+    values = obj._limited_values
+
     if obj.connector is not None:
         linewidth = _svglinewidth(obj.linewidth)
         linestyle = _svglinestyle(obj.linestyle, obj.linewidth)
         lineopacity = _svgopacity(obj.linecolor)
         linecolor = _svgcolor(obj.linecolor)
 
-        pathdata = []
         if obj.connector == "xsort":
             limvals = obj._xlimited_values
         elif obj.connector == "ysort":
             limvals = obj._ylimited_values
         elif obj.connector == "unsorted":
             limvals = obj._xlimited_values
-        for xval, yval in limvals:
-            if len(pathdata) == 0:
-                pathdata.append("M %g %g" % t(xval, yval))
-            else:
-                pathdata.append("L %g %g" % t(xval, yval))
-        pathdata = " ".join(pathdata)
-
-        svg.body.append(u"""    <path d="%(pathdata)s" stroke-width="%(linewidth)g" stroke-dasharray="%(linestyle)s" stroke="%(linecolor)s" stroke-opacity="%(lineopacity)g" fill="none" />""" % vars())
 
-    if "ex" in obj.sig:
-        lineopacity = _svgopacity(obj.linecolor)
-        linecolor = _svgcolor(obj.linecolor)
+        svg.body.append(u'    <path d="')
+        if len(limvals) > 0:
+            chunks = _svgbulk("L%g %g ", (tx(limvals[:,0]), ty(limvals[:,1])))
+            for chunk in chunks:
+                svg.body.append("M" + chunk[1:])
+                break
+            svg.body.extend(chunks)
+        svg.body.append(u"""" stroke-width="%(linewidth)g" stroke-dasharray="%(linestyle)s" stroke="%(linecolor)s" stroke-opacity="%(lineopacity)g" fill="none" />""" % vars())
 
+    # all error bars of a plot are segments of a single path
+    errorbars = []
+    if "ex" in obj.sig and not density and len(values) > 0:
         if "exl" in obj.sig: exlindex = obj.index()["exl"]
         else: exlindex = obj.index()["ex"]
         exindex = obj.index()["ex"]
 
-        def down(x, y): return x, y - 5.
-        def up(x, y): return x, y + 5.
-
-        for value in obj._limited_values:
-            x, y, exl, ex = value[xindex], value[yindex], abs(value[exlindex]), abs(value[exindex])
-            pathdata = ["M %g %g" % t(x - exl, y),
-                        "L %g %g" % t(x + ex, y),
-                        "M %g %g" % down(*t(x - exl, y)),
-                        "L %g %g" % up(*t(x - exl, y)),
-                        "M %g %g" % down(*t(x + ex, y)),
-                        "L %g %g" % up(*t(x + ex, y))]
-            pathdata = " ".join(pathdata)
-            svg.body.append(u"""    <path d="%(pathdata)s" stroke="%(linecolor)s" stroke-opacity="%(lineopacity)g" fill="none" />""" % vars())
-
-    if "ey" in obj.sig:
-        lineopacity = _svgopacity(obj.linecolor)
-        linecolor = _svgcolor(obj.linecolor)
+        x, y = values[:,xindex], ty(values[:,yindex])
+        lowx, highx = tx(x - abs(values[:,exlindex])), tx(x + abs(values[:,exindex]))
+        errorbars.append(_svgbulk("M%g %gH%gM%g %gv10M%g %gv10", (lowx, y, highx, lowx, y - 5., highx, y - 5.)))
 
+    if "ey" in obj.sig and not density and len(values) > 0:
         if "eyl" in obj.sig: eylindex = obj.index()["eyl"]
         else: eylindex = obj.index()["ey"]
         eyindex = obj.index()["ey"]
 
-        def down(x, y): return x - 5., y
-        def up(x, y): return x + 5., y
-
-        for value in obj._limited_values:
-            x, y, eyl, ey = value[xindex], value[yindex], abs(value[eylindex]), abs(value[eyindex])
-            pathdata = ["M %g %g" % t(x, y - eyl),
-                        "L %g %g" % t(x, y + ey),
-                        "M %g %g" % down(*t(x, y - eyl)),
-                        "L %g %g" % up(*t(x, y - eyl)),
-                        "M %g %g" % down(*t(x, y + ey)),
-                        "L %g %g" % up(*t(x, y + ey))]
-            pathdata = " ".join(pathdata)
-            svg.body.append(u"""    <path d="%(pathdata)s" stroke="%(linecolor)s" stroke-opacity="%(lineopacity)g" fill="none" />""" % vars())
-
-    if obj.marker is not None:
-        for value in obj._limited_values:
-            x, y = t(value[xindex], value[yindex])
-            svg.body.append(u"""    <use x="%(x)g" y="%(y)g" xlink:href="%(h)s%(plotmarkname)s" />""" % vars())
+        x, y = tx(values[:,xindex]), values[:,yindex]
+        lowy, highy = ty(y - abs(values[:,eylindex])), ty(y + abs(values[:,eyindex]))
+        errorbars.append(_svgbulk("M%g %gV%gM%g %gh10M%g %gh10", (x, lowy, highy, x - 5., lowy, x - 5., highy)))
+
+    if len(errorbars) > 0:
+        lineopacity = _svgopacity(obj.linecolor)
+        linecolor = _svgcolor(obj.linecolor)
+
+        svg.body.append(u'    <path d="')
+        for chunks in errorbars:
+            svg.body.extend(chunks)
+        svg.body.append(u"""" stroke="%(linecolor)s" stroke-opacity="%(lineopacity)g" fill="none" />""" % vars())
+
+    if obj.marker is not None and not density and len(values) > 0:
+        columns = tx(values[:,xindex]), ty(values[:,yindex])
+        markerpath = _markerpath(obj.marker, _svgmarkersize(obj.markersize))
+
+        # opaque markers of one color look the same as one path; translucent or
+        # outlined ones must overlap as separate elements (each outline over the
+        # markers drawn before it)
+        merge = (obj.marker in ("plus", "times") or markeroutline == "none")
+        if markerpath is not None and merge and markeropacity == 1.:
+            svg.body.append(u'    <path d="')
+            svg.body.extend(_svgbulk(markerpath, columns))
+            if obj.marker in ("plus", "times"):
+                svg.body.append(u"""" stroke="%(markercolor)s" stroke-opacity="%(markeropacity)g" />""" % vars())
+            else:
+                svg.body.append(u"""" stroke="%(markeroutline)s" stroke-opacity="%(markeroutlineopacity)g" fill="%(markercolor)s" fill-opacity="%(markeropacity)g" />""" % vars())
+        else:
+            use = u"""    <use x="%%g" y="%%g" xlink:href="#%s" />\n""" % plotmarkname
+            for chunk in _svgbulk(use, columns):
+                svg.body.append(chunk[:-1])
 
     svg.body.append(u"""</g>""")
 
@@ -870,10 +1479,10 @@ def _draw_Scatter(obj, **kwds):
 
 def _frameargs_posthook_Scatter(obj, output, **kwds):
     f = obj._frameargs()
-    if f.get("xticks", containers.Auto) is containers.Auto and getattr(obj, "_xticks", None) is not None:
-        output["xticks"] = obj._xticks
-    if f.get("yticks", containers.Auto) is containers.Auto and getattr(obj, "_yticks", None) is not None:
-        output["yticks"] = obj._yticks
+    if f.get("xticks", containers.Auto) is containers.Auto and getattr(obj, "_xcategories", None) is not None:
+        output["xticks"] = dict((value, label) for label, value in obj._xcategories.items())
+    if f.get("yticks", containers.Auto) is containers.Auto and getattr(obj, "_ycategories", None) is not None:
+        output["yticks"] = dict((value, label) for label, value in obj._ycategories.items())
     return output
 
 def _draw_TimeSeries(obj, **kwds):
@@ -884,15 +1493,17 @@ def _frameargs_prehook_TimeSeries(obj, output, **kwds):
         output["xmin"] = obj.fromtimestring(output["xmin"])
     if "xmax" in output and output["xmax"] is not None and output["xmax"] is not containers.Auto and isinstance(output["xmax"], basestring):
         output["xmax"] = obj.fromtimestring(output["xmax"])
+    if output.get("xticks", containers.Auto) is containers.Auto:
+        output["xticks"] = obj.calendarticks()
+
     return output
 
 def _frameargs_posthook_TimeSeries(obj, output, **kwds):
-    f = obj._frameargs()
-    if "xticks" not in f or f["xticks"] is containers.Auto:
-        xticks = output["xticks"]
-        for value, name in xticks.items():
-            if name is not None:
-                xticks[value] = obj.totimestring(value)
+    # only if draw(..., xticks=Auto) overrode the calendar ticks set in the prehook
+    if kwds.get("xticks", None) is containers.Auto:
+        xticks = dict(output["xticks"])
+        values = [value for value, name in xticks.items() if name is not None]
+        xticks.update(zip(values, obj.totimestring(values)))
         output["xticks"] = xticks
     return output
 
@@ -904,6 +1515,7 @@ def _draw_ColorField(obj, **kwds):
     wx1, wy1, wx2, wy2 = _get_window(**kwds)
     windowwidth, windowheight = wx2 - wx1, wy2 - wy1
     xmin, ymin, xmax, ymax, xlog, ylog = f["xmin"], f["ymin"], f["xmax"], f["ymax"], f["xlog"], f["ylog"]
+    t = _get_transform(**kwds)
 
     xbins, ybins = obj.xbins(), obj.ybins()
     zmin, zmax = obj.zranges()
@@ -912,16 +1524,25 @@ def _draw_ColorField(obj, **kwds):
     if obj.zmax is not containers.Auto:
         zmax = obj.zmax
 
-    image = PIL.Image.new("RGBA", (xbins, ybins), (0, 0, 0, 255))
-    for i in xrange(xbins):
-        for j in xrange(ybins):
-            col = obj.tocolor(obj.values[i,j], zmin, zmax)
-            if isinstance(col, color.RGB):
-                col = col.ints()
-            elif isinstance(col, (color.AbstractColor, basestring)):
-                col = color.RGB(col).ints()
+    def toints(col):
+        if isinstance(col, color.RGB):
+            return col.ints()
+        elif isinstance(col, (color.AbstractColor, basestring)):
+            return color.RGB(col).ints()
+        return col
 
-            image.putpixel((i, ybins-j-1), col)
+    if obj.components() == 1:
+        # one call to tocolor per distinct value, not per pixel
+        distinct, inverse = numpy.unique(obj.values, return_inverse=True)
+        palette = numpy.array([toints(obj.tocolor(value, zmin, zmax)) for value in distinct], dtype=numpy.uint8)
+        pixels = palette[inverse].reshape((xbins, ybins, 4))
+        image = PIL.Image.fromarray(numpy.ascontiguousarray(pixels.transpose((1, 0, 2))[::-1]), "RGBA")
+
+    else:
+        image = PIL.Image.new("RGBA", (xbins, ybins), (0, 0, 0, 255))
+        for i in xrange(xbins):
+            for j in xrange(ybins):
+                image.putpixel((i, ybins-j-1), toints(obj.tocolor(obj.values[i,j], zmin, zmax)))
 
     buff = StringIO.StringIO()
     image.save(buff, "PNG")
@@ -932,10 +1553,10 @@ def _draw_ColorField(obj, **kwds):
     else:
         smooth = "optimizeSpeed"
 
-    xpos = _transformX(obj.xmin, wx1, wx2, xmin, xmax, xlog)
-    xpos2 = _transformX(obj.xmax, wx1, wx2, xmin, xmax, xlog)
-    ypos = _transformY(obj.ymin, wy1, wy2, ymin, ymax, ylog)
-    ypos2 = _transformY(obj.ymax, wy1, wy2, ymin, ymax, ylog)
+    xpos = t.x(obj.xmin)
+    xpos2 = t.x(obj.xmax)
+    ypos = t.y(obj.ymin)
+    ypos2 = t.y(obj.ymax)
     width = xpos2 - xpos
     height = ypos - ypos2
 
@@ -964,6 +1585,7 @@ def _draw_Region(obj, **kwds):
     wx1, wy1, wx2, wy2 = _get_window(**kwds)
     windowwidth, windowheight = wx2 - wx1, wy2 - wy1
     xmin, ymin, xmax, ymax, xlog, ylog = f["xmin"], f["ymin"], f["xmax"], f["ymax"], f["xlog"], f["ylog"]
+    t = _get_transform(**kwds)
 
     plotname = svg.uniquename(obj.__class__.__name__)
     plotclipname = "%s_clip" % plotname
@@ -983,12 +1605,12 @@ def _draw_Region(obj, **kwds):
             if isinstance(x, mathtools.InfiniteType):
                 x = (wx1 + wx2)/2. + windowwidth/mathtools.epsilon * x._multiplier
             else:
-                x = _transformX(x, wx1, wx2, xmin, xmax, xlog)
+                x = t.x(x)
 
             if isinstance(y, mathtools.InfiniteType):
                 y = (wy1 + wy2)/2. - windowwidth/mathtools.epsilon * y._multiplier
             else:
-                y = _transformY(y, wy1, wy2, ymin, ymax, ylog)
+                y = t.y(y)
 
             if isinstance(command, containers.MoveTo):
                 pathdata.append("M %g %g" % (x, y))
@@ -1015,6 +1637,7 @@ def _draw_RegionMap(obj, **kwds):
     wx1, wy1, wx2, wy2 = _get_window(**kwds)
     windowwidth, windowheight = wx2 - wx1, wy2 - wy1
     xmin, ymin, xmax, ymax, xlog, ylog = f["xmin"], f["ymin"], f["xmax"], f["ymax"], f["xlog"], f["ylog"]
+    t = _get_transform(**kwds)
 
     if obj.smooth:
         smooth = "optimizeQuality"
@@ -1031,10 +1654,10 @@ def _draw_RegionMap(obj, **kwds):
     image.save(buff, "PNG")
     encoded = base64.b64encode(buff.getvalue())
     
-    xpos = _transformX(obj.xmin, wx1, wx2, xmin, xmax, xlog)
-    xpos2 = _transformX(obj.xmax, wx1, wx2, xmin, xmax, xlog)
-    ypos = _transformY(obj.ymin, wy1, wy2, ymin, ymax, ylog)
-    ypos2 = _transformY(obj.ymax, wy1, wy2, ymin, ymax, ylog)
+    xpos = t.x(obj.xmin)
+    xpos2 = t.x(obj.xmax)
+    ypos = t.y(obj.ymin)
+    ypos2 = t.y(obj.ymax)
     width = xpos2 - xpos
     height = ypos - ypos2
 
@@ -1108,8 +1731,7 @@ def _draw_Line(obj, **kwds):
     wx1, wy1, wx2, wy2 = _get_window(**kwds)
     windowwidth, windowheight = wx2 - wx1, wy2 - wy1
     xmin, ymin, xmax, ymax, xlog, ylog = f["xmin"], f["ymin"], f["xmax"], f["ymax"], f["xlog"], f["ylog"]
-    def t(x, y):
-        return _transformX(x, wx1, wx2, xmin, xmax, xlog), _transformY(y, wy1, wy2, ymin, ymax, ylog)
+    t = _get_transform(**kwds)
 
     plotname = svg.uniquename(obj.__class__.__name__)
     plotclipname = "%s_clip" % plotname
@@ -1129,12 +1751,12 @@ def _draw_Line(obj, **kwds):
         if isinstance(obj.x1, mathtools.InfiniteType):
             x = (wx1 + wx2)/2. + windowwidth/mathtools.epsilon * obj.x1._multiplier
         else:
-            x = _transformX(obj.x1, wx1, wx2, xmin, xmax, xlog)
+            x = t.x(obj.x1)
 
         if isinstance(obj.y1, mathtools.InfiniteType):
             y = (wy1 + wy2)/2. - windowwidth/mathtools.epsilon * obj.y1._multiplier
         else:
-            y = _transformY(obj.y1, wy1, wy2, ymin, ymax, ylog)
+            y = t.y(obj.y1)
 
         pathdata.append("L %g %g" % (x, y))
 
@@ -1144,12 +1766,12 @@ def _draw_Line(obj, **kwds):
         if isinstance(obj.x2, mathtools.InfiniteType):
             x = (wx1 + wx2)/2. + windowwidth/mathtools.epsilon * obj.x2._multiplier
         else:
-            x = _transformX(obj.x2, wx1, wx2, xmin, xmax, xlog)
+            x = t.x(obj.x2)
 
         if isinstance(obj.y2, mathtools.InfiniteType):
             y = (wy1 + wy2)/2. - windowwidth/mathtools.epsilon * obj.y2._multiplier
         else:
-            y = _transformY(obj.y2, wy1, wy2, ymin, ymax, ylog)
+            y = t.y(obj.y2)
 
         pathdata.append("L %g %g" % (x, y))
 
@@ -1178,8 +1800,7 @@ def _draw_Grid(obj, **kwds):
     wx1, wy1, wx2, wy2 = _get_window(**kwds)
     windowwidth, windowheight = wx2 - wx1, wy2 - wy1
     xmin, ymin, xmax, ymax, xlog, ylog = f["xmin"], f["ymin"], f["xmax"], f["ymax"], f["xlog"], f["ylog"]
-    def t(x, y):
-        return _transformX(x, wx1, wx2, xmin, xmax, xlog), _transformY(y, wy1, wy2, ymin, ymax, ylog)
+    t = _get_transform(**kwds)
 
     obj._prepare(xmin, ymin, xmax, ymax)
 
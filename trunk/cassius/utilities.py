@@ -1,5 +1,7 @@
 # Standard Python packages
 import math
+import calendar
+import collections
 import numbers
 import time
 
@@ -81,7 +83,7 @@ def _compute_majorticks(low, high, N, format):
         output = {}
         x = low
         for i in xrange(N):
-            if format == unicode_number and abs(x) < eps: label = u"0"
+            if getattr(format, "format", format) == unicode_number and abs(x) < eps: label = u"0"
             else: label = format(x)
             output[x] = label
             x += (high - low)/(N-1.)
@@ -89,6 +91,69 @@ def _compute_majorticks(low, high, N, format):
 
     N = -N
 
+    granularity = _nice_granularity(low, high, N)
+    if granularity is None:
+        return _compute_majorticks_iterative(low, high, N, format)
+    return _majorticks_at(low, high, granularity, None, format)
+
+def _nice_number(index):
+    # the 1, 2, 5, 10, 20, 50, ... sequence: index 0 is 1, index 3 is 10, index -1 is 0.5
+    return (1., 2., 5.)[index % 3] * 10.**(index // 3)
+
+def _nice_count(low, high, granularity):
+    return int(math.floor(1.*high / granularity) - math.ceil(1.*low / granularity)) + 1
+
+def _nice_granularity(low, high, N):
+    """Return the granularity that the iterative search in
+    `_compute_majorticks_iterative` would settle on, or `None` if its
+    special cases (too few ticks at the coarsest granularity) apply.
+
+    Any granularity coarser than (high - low)/(N - 1) has fewer than N
+    ticks, so the search can start just above it instead of at the
+    order of magnitude of max(|low|, |high|).
+    """
+
+    if N < 4: return None
+    top = 3 * int(math.ceil(math.log10(max(abs(low), abs(high)))))
+    target = (high - low)/(N - 1.)
+
+    index = 3 * int(math.floor(math.log10(target)))
+    while _nice_number(index) <= target: index += 1
+    while _nice_number(index - 1) > target: index -= 1
+    if index >= top or _nice_count(low, high, _nice_number(index + 1)) < 1:
+        return None
+
+    while _nice_count(low, high, _nice_number(index - 1)) < N:
+        index -= 1
+    return _nice_number(index)
+
+def _majorticks_at(low, high, granularity, trial, format):
+    eps = mathtools.epsilon * (high - low)
+
+    if trial is None:
+        trial = {}
+        for n in range(int(math.ceil(1.*low / granularity)), int(math.floor(1.*high / granularity))+1):
+            x = n * granularity
+            if getattr(format, "format", format) == unicode_number and abs(x) < eps: label = u"0"
+            else: label = format(x)
+            trial[x] = label
+
+    low_in_ticks, high_in_ticks = False, False
+    for t in trial.keys():
+        if 1.*abs(t - low)/granularity < mathtools.epsilon: low_in_ticks = True
+        if 1.*abs(t - high)/granularity < mathtools.epsilon: high_in_ticks = True
+
+    lowN = 1.*low / granularity
+    highN = 1.*high / granularity
+    if abs(lowN - round(lowN)) < mathtools.epsilon and not low_in_ticks:
+        trial[low] = format(low)
+    if abs(highN - round(highN)) < mathtools.epsilon and not high_in_ticks:
+        trial[high] = format(high)
+    return trial
+
+def _compute_majorticks_iterative(low, high, N, format):
+    eps = mathtools.epsilon * (high - low)
+
     counter = 0
     granularity = 10**math.ceil(math.log10(max(abs(low), abs(high))))
     lowN = math.ceil(1.*low / granularity)
@@ -110,7 +175,7 @@ def _compute_majorticks(low, high, N, format):
         trial = {}
         for n in range(int(lowN), int(highN)+1):
             x = n * granularity
-            if format == unicode_number and abs(x) < eps: label = u"0"
+            if getattr(format, "format", format) == unicode_number and abs(x) < eps: label = u"0"
             else: label = format(x)
             trial[x] = label
 
@@ -119,18 +184,7 @@ def _compute_majorticks(low, high, N, format):
                 v1, v2 = low, high
                 return {v1: format(v1), v2: format(v2)}
             else:
-                low_in_ticks, high_in_ticks = False, False
-                for t in last_trial.keys():
-                    if 1.*abs(t - low)/last_granularity < mathtools.epsilon: low_in_ticks = True
-                    if 1.*abs(t - high)/last_granularity < mathtools.epsilon: high_in_ticks = True
-
-                lowN = 1.*low / last_granularity
-                highN = 1.*high / last_granularity
-                if abs(lowN - round(lowN)) < mathtools.epsilon and not low_in_ticks:
-                    last_trial[low] = format(low)
-                if abs(highN - round(highN)) < mathtools.epsilon and not high_in_ticks:
-                    last_trial[high] = format(high)
-                return last_trial
+                return _majorticks_at(low, high, last_granularity, last_trial, format)
 
         last_granularity = granularity
         last_trial = trial
@@ -151,7 +205,8 @@ def _compute_minorticks(low, high, major_ticks):
     granularities = []
     for i in range(len(major_ticks)-1):
         granularities.append(major_ticks[i+1] - major_ticks[i])
-    spacing = 10**(math.ceil(math.log10(min(granularities)) - 1))
+    # (tolerate round-off in the major tick spacing, which would otherwise drop the minor ticks)
+    spacing = 10**(math.ceil(math.log10(min(granularities)) - 1e-6) - 1)
 
     output = {}
     x = major_ticks[0] - math.ceil(1.*(major_ticks[0] - low) / spacing) * spacing
@@ -175,7 +230,7 @@ def _compute_logmajorticks(low, high, base, N, format):
       output = {}
       x = low
       for i in xrange(N):
-        if format == unicode_number and abs(x) < eps: label = u"0"
+        if getattr(format, "format", format) == unicode_number and abs(x) < eps: label = u"0"
         else: label = format(x)
         output[x] = label
         x += (high - low)/(N-1.)
@@ -229,6 +284,42 @@ def _compute_logminorticks(low, high, base):
     if num_ticks <= 2: return {}
     else: return output
 
+# most recently used tick-marks (by low, high, major, minor, logbase, format); the last item is the newest
+# (these dicts are never handed out: callers get a copy that they can modify)
+_tickmarks_cache = collections.OrderedDict()
+_tickmarks_cachesize = 1024
+
+_string_formats = {}
+
+def _string_format(format):
+    # one function per format string, so that its tick-marks and labels can be cached
+    if format not in _string_formats:
+        output = lambda x: format % x
+        output.func_name = format
+        _string_formats[format] = output
+    return _string_formats[format]
+
+_ticklabel_caches = {}
+
+def _ticklabels(format):
+    # format, remembering the label of each value
+    if format not in _ticklabel_caches:
+        if len(_ticklabel_caches) >= 100:
+            _ticklabel_caches.clear()
+        memo = {}
+        def output(x):
+            try:
+                return memo[x]
+            except KeyError:
+                if len(memo) >= 10000:
+                    memo.clear()
+                label = memo[x] = format(x)
+                return label
+        output.func_name = format.func_name
+        output.format = format
+        _ticklabel_caches[format] = output
+    return _ticklabel_caches[format]
+
 def tickmarks(major=-10, minor=True, logbase=0, format=unicode_number):
     """Return a function that can be used to set standard tick marks.
 
@@ -271,15 +362,15 @@ def tickmarks(major=-10, minor=True, logbase=0, format=unicode_number):
     """
 
     if not callable(format):
-        tmp = format
-        format = lambda x: tmp % x
-        format.func_name = tmp
+        format = _string_format(format)
+
+    labels = _ticklabels(format)
 
     def linear_tickmarks(low, high):
         if low >= high:
             raise ValueError, "To compute tick-marks, 'low' must be lower than 'high'."
 
-        major_ticks = _compute_majorticks(low, high, major, format)
+        major_ticks = _compute_majorticks(low, high, major, labels)
         if minor:
             minor_ticks = _compute_minorticks(low, high, major_ticks)
         else:
@@ -291,7 +382,7 @@ def tickmarks(major=-10, minor=True, logbase=0, format=unicode_number):
         if low >= high:
             raise ValueError, "To compute tick-marks, 'low' must be lower than 'high'."
 
-        major_ticks = _compute_logmajorticks(low, high, logbase, major, format)
+        major_ticks = _compute_logmajorticks(low, high, logbase, major, labels)
         if minor:
             minor_ticks = _compute_logminorticks(low, high, logbase)
         else:
@@ -299,21 +390,38 @@ def tickmarks(major=-10, minor=True, logbase=0, format=unicode_number):
         minor_ticks.update(major_ticks)
         return minor_ticks
 
-    if logbase == 0: output = linear_tickmarks
-    else: output = logarithmic_tickmarks
+    if logbase == 0: compute = linear_tickmarks
+    else: compute = logarithmic_tickmarks
+
+    def output(low, high):
+        key = (low, high, major, minor, logbase, format)
+        try:
+            result = _tickmarks_cache.pop(key)
+        except KeyError:
+            result = compute(low, high)
+            if len(_tickmarks_cache) >= _tickmarks_cachesize:
+                _tickmarks_cache.popitem(last=False)
+        _tickmarks_cache[key] = result
+        return dict(result)
 
     output.func_name = "tickmarks(major=%d, minor=%s, logbase=%d, format=%s)" % (major, repr(minor), logbase, format.func_name)
     return output
 
 def calcrange(data, log=False):
     """Return the range (min, max) of a dataset, excluding any NANs."""
-    xmin, xmax = None, None
-    for x in data:
-        if not log or x > 0.:
-            if xmin is None or x < xmin: xmin = x
-            if xmax is None or x > xmax: xmax = x
+    if not isinstance(data, numpy.ndarray):
+        data = numpy.array(data)
+    if log:
+        data = data[data > 0.]
 
-    if xmin is None and xmax is None:
+    if len(data) > 0:
+        xmin, xmax = data.min(), data.max()
+        if numpy.isnan(xmin) or numpy.isnan(xmax):
+            data = data[numpy.logical_not(numpy.isnan(data))]
+            if len(data) > 0:
+                xmin, xmax = data.min(), data.max()
+
+    if len(data) == 0:
         if log:
             return 0.1, 1.
         else:
@@ -363,6 +471,38 @@ def binning(data, low, high):
 def binning_sturges(data, low, high):
     raise NotImplementedError # FIXME
 
+def categorize(data, categories=None):
+    """Convert a list of category labels into numerical positions.
+
+    Arguments:
+       data (list or numpy array of strings): category labels
+
+       categories (dict or `None`): mapping of labels to positions;
+       labels not yet in the dict are added (in sorted order, after
+       the existing ones), so passing the same dict to several calls
+       makes their positions line up
+
+    Returns:
+       A numpy array of positions (1, 2, 3, ...) and the `categories`
+       dict (a new one if `categories` was `None`).
+    """
+
+    if categories is None: categories = {}
+
+    unique, inverse = numpy.unique(data, return_inverse=True)
+    unique = unique.tolist()
+
+    # new labels go after the highest existing position, which may not be len(categories)
+    if len(categories) > 0: position = float(max(categories.values()))
+    else: position = 0.
+    for label in unique:
+        if label not in categories:
+            position += 1.
+            categories[label] = position
+
+    codes = numpy.array([categories[label] for label in unique], dtype=numpy.float)
+    return codes[inverse], categories
+
 def timesec(year=None, month=None, day=None, hour=None, min=None, sec=None):
     """Quickly obtain a number of seconds from the current time or a given time.
 
@@ -395,6 +535,139 @@ def timesec(year=None, month=None, day=None, hour=None, min=None, sec=None):
     if sec is None: sec = now.tm_sec
     return time.mktime(time.struct_time((year, month, day, hour, min, sec, -1, -1, -1))) + subsecs
 
+# strptime directives that always have the same number of digits in fixed-width time strings
+_fixedwidth_directives = {"Y": 4, "y": 2, "m": 2, "d": 2, "H": 2, "M": 2, "S": 2}
+_fixedwidth_formats = {}
+
+def _fixedwidth_format(format):
+    """Return (width, fields, literals) for a fixed-width time format or `None` if it isn't one."""
+
+    if format not in _fixedwidth_formats:
+        width, fields, literals = 0, {}, []
+        i = 0
+        while i < len(format):
+            if format[i] != "%":
+                literals.append((width, ord(format[i])))
+                width += 1
+                i += 1
+            elif format[i+1:i+2] == "%":
+                literals.append((width, ord("%")))
+                width += 1
+                i += 2
+            elif format[i+1:i+2] in _fixedwidth_directives and format[i+1] not in fields:
+                fields[format[i+1]] = (width, _fixedwidth_directives[format[i+1]])
+                width += _fixedwidth_directives[format[i+1]]
+                i += 2
+            else:
+                width = None
+                break
+
+        if width is None or ("Y" in fields and "y" in fields):
+            _fixedwidth_formats[format] = None
+        else:
+            _fixedwidth_formats[format] = width, fields, literals
+
+    return _fixedwidth_formats[format]
+
+def _days_from_civil(year, month, day):
+    # days since Jan 1, 1970 in the proleptic Gregorian calendar (works on numpy arrays)
+    year = year - (month <= 2)
+    era = year // 400
+    yoe = year - era*400
+    doy = (153*(month + numpy.where(month > 2, -3, 9)) + 2)//5 + day - 1
+    return era*146097 + yoe*365 + yoe//4 - yoe//100 + doy - 719468
+
+def _fromtimestring_fixedwidth(timestrings, fixed, subseconds):
+    # returns seconds since epoch (UTC) or None if any string doesn't fit the fixed-width format
+    width, fields, literals = fixed
+
+    try:
+        strings = numpy.array(timestrings, dtype=numpy.string_)
+    except (UnicodeEncodeError, ValueError):
+        return None
+    if strings.ndim != 1 or strings.dtype.itemsize < width or width == 0:
+        return None
+
+    itemsize = strings.dtype.itemsize
+    chars = strings.view(numpy.uint8).reshape((len(strings), itemsize))
+    if not numpy.all(chars[:,width-1] != 0):
+        return None
+
+    for position, char in literals:
+        if not numpy.all(chars[:,position] == char):
+            return None
+
+    def number(position, digits):
+        block = chars[:,position:position+digits].astype(numpy.int64) - 48
+        if not numpy.all(numpy.logical_and(block >= 0, block <= 9)):
+            raise ValueError
+        return numpy.dot(block, 10**numpy.arange(digits - 1, -1, -1, dtype=numpy.int64))
+
+    try:
+        values = {}
+        for code, (position, digits) in fields.items():
+            values[code] = number(position, digits)
+    except ValueError:
+        return None
+
+    if "Y" in values:
+        year = values["Y"]
+    elif "y" in values:
+        year = values["y"] + numpy.where(values["y"] <= 68, 2000, 1900)
+    else:
+        year = numpy.zeros(len(strings), dtype=numpy.int64) + 1970
+    month = values.get("m", 1)
+    day = values.get("d", 1)
+    hour, minute, second = values.get("H", 0), values.get("M", 0), values.get("S", 0)
+
+    # anything out of range goes to the slow path, which raises the appropriate error
+    monthlength = numpy.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[numpy.clip(month, 1, 12) - 1]
+    monthlength = monthlength + ((month == 2) & (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0)))
+    if not (numpy.all((1 <= month) & (month <= 12)) and numpy.all((1 <= day) & (day <= monthlength)) and
+            numpy.all(hour <= 23) and numpy.all(minute <= 59) and numpy.all(second <= 61)):
+        return None
+
+    output = (_days_from_civil(year, month, day)*86400 + hour*3600 + minute*60 + second).astype(numpy.float)
+
+    if subseconds:
+        if itemsize <= width or not numpy.all(chars[:,width] == ord(".")) or itemsize - width - 1 > 15:
+            return None
+        block = chars[:,width+1:].astype(numpy.int64) - 48
+        block[chars[:,width+1:] == 0] = 0
+        if not numpy.all(numpy.logical_and(block >= 0, block <= 9)):
+            return None
+        digits = itemsize - width - 1
+        output += numpy.dot(block, 10**numpy.arange(digits - 1, -1, -1, dtype=numpy.int64)) / 10.**digits
+
+    elif itemsize != width:
+        return None
+
+    return output
+
+def _strptime_converter(format, subseconds):
+    """Return a function that converts one time string into seconds with `time.strptime`."""
+
+    no_year = (format.find("%y") == -1 and format.find("%Y") == -1)
+
+    # times are UTC (like the fixed-width path and totimestring), unless the string names its time zone
+    has_zone = (format.find("%Z") != -1)
+
+    def convert(timestring):
+        if subseconds:
+            pytimestring, subsecs = timestring.split(".")
+            subsecs = float("0." + subsecs)
+        else:
+            pytimestring, subsecs = timestring, 0.
+        tmp = time.strptime(pytimestring, format)
+        tmp = [tmp.tm_year, tmp.tm_mon, tmp.tm_mday, tmp.tm_hour, tmp.tm_min, tmp.tm_sec, tmp.tm_wday, tmp.tm_yday, tmp.tm_isdst]
+        if no_year:
+            tmp[0] = 1970
+        if has_zone:
+            return time.mktime(tuple(tmp)) + subsecs
+        return calendar.timegm(tuple(tmp)) + subsecs
+
+    return convert
+
 def fromtimestring(timestrings, format, subseconds=False, t0=0.):
     """Convert a time string or many time strings into a number(s) of seconds.
 
@@ -419,58 +692,208 @@ def fromtimestring(timestrings, format, subseconds=False, t0=0.):
 
        Subseconds are _always_ at the end of the string, regardless of
        where the seconds appear in the format (if at all).
+
+       Formats built only from zero-padded numerical fields (`%Y`,
+       `%y`, `%m`, `%d`, `%H`, `%M`, `%S`) and literal characters,
+       such as the default "%Y-%m-%d %H:%M:%S", are converted all at
+       once by array arithmetic when every string has the same width;
+       all other strings are converted one at a time with
+       `time.strptime`, and repeated strings are converted only once.
+
+       Times (and `t0`, if it is a string) are interpreted as UTC,
+       the same convention that `totimestring` uses, unless the
+       format includes "%Z", in which case the named local time zone
+       applies.
     """
 
+    if format is not None:
+        convert = _strptime_converter(format, subseconds)
+
     if isinstance(t0, (numbers.Number, numpy.number)) or format is None:
         t0 = float(t0)
     else:
-        if subseconds:
-            pytimestring, subsecs = t0.split(".")
-            subsecs = float("0." + subsecs)
-        else:
-            pytimestring, subsecs = t0, 0.
-        tmp = time.strptime(pytimestring, format)
-        tmp = [tmp.tm_year, tmp.tm_mon, tmp.tm_mday, tmp.tm_hour, tmp.tm_min, tmp.tm_sec, tmp.tm_wday, tmp.tm_yday, tmp.tm_isdst]
-        if format.find("%y") == -1 and format.find("%Y") == -1:
-            tmp[0] = 1970
-        tzoffset = 0
-        if format.find("%Z") == -1:
-            # if time.daylight:
-            #     tzoffset = time.altzone
-            # else:
-                tzoffset = time.timezone
-        t0 = time.mktime(tuple(tmp)) - tzoffset + subsecs
+        t0 = convert(t0)
 
     single_value = False
     if isinstance(timestrings, basestring):
         single_value = True
         timestrings = [timestrings]
 
-    output = numpy.empty(len(timestrings), dtype=numpy.float)
-    for i, timestring in enumerate(timestrings):
-        if format is None:
-            output[i] = float(timestring)
-        else:
-            if subseconds:
-                pytimestring, subsecs = timestring.split(".")
-                subsecs = float("0." + subsecs)
-            else:
-                pytimestring, subsecs = timestring, 0.
-            tmp = time.strptime(pytimestring, format)
-            tmp = [tmp.tm_year, tmp.tm_mon, tmp.tm_mday, tmp.tm_hour, tmp.tm_min, tmp.tm_sec, tmp.tm_wday, tmp.tm_yday, tmp.tm_isdst]
-            if format.find("%y") == -1 and format.find("%Y") == -1:
-                tmp[0] = 1970
-            tzoffset = 0
-            if format.find("%Z") == -1:
-                # if time.daylight:
-                #     tzoffset = time.altzone
-                # else:
-                    tzoffset = time.timezone
-            output[i] = time.mktime(tuple(tmp)) - tzoffset + subsecs - t0
+    if format is None:
+        output = numpy.array(timestrings, dtype=numpy.float)
+
+    else:
+        output = None
+        fixed = _fixedwidth_format(format)
+        if fixed is not None and len(timestrings) > 0:
+            output = _fromtimestring_fixedwidth(timestrings, fixed, subseconds)
+            if output is not None:
+                output -= t0
+
+        if output is None:
+            memo = {}
+            output = numpy.empty(len(timestrings), dtype=numpy.float)
+            for i, timestring in enumerate(timestrings):
+                try:
+                    output[i] = memo[timestring]
+                except KeyError:
+                    output[i] = memo[timestring] = convert(timestring) - t0
 
     if single_value: return output[0]
     else: return output
 
+def _civil_from_days(days):
+    # (year, month, day) of days since Jan 1, 1970 in the proleptic Gregorian calendar (inverse of _days_from_civil)
+    z = days + 719468
+    era = z // 146097
+    doe = z - era*146097
+    yoe = (doe - doe//1460 + doe//36524 - doe//146096) // 365
+    doy = doe - (365*yoe + yoe//4 - yoe//100)
+    mp = (5*doy + 2)//153
+    day = doy - (153*mp + 2)//5 + 1
+    month = mp + numpy.where(mp < 10, 3, -9)
+    year = yoe + era*400 + (month <= 2)
+    return year, month, day
+
+def _totimestring_fixedwidth(secs, fixed):
+    # returns a list of strings for integer seconds since epoch (UTC) or None if they can't be formatted this way
+    width, fields, literals = fixed
+    if width == 0 or any(char > 127 for position, char in literals):
+        return None
+
+    days, seconds = divmod(secs, 86400)
+    year, month, day = _civil_from_days(days)
+    # time.strftime refuses years before 1900
+    if not numpy.all((1900 <= year) & (year <= 9999)):
+        return None
+
+    values = {"Y": year, "y": year % 100, "m": month, "d": day, "H": seconds // 3600, "M": (seconds // 60) % 60, "S": seconds % 60}
+
+    chars = numpy.empty((len(secs), width), dtype=numpy.uint8)
+    for position, char in literals:
+        chars[:,position] = char
+    for code, (position, digits) in fields.items():
+        for i in xrange(digits):
+            chars[:,position + i] = 48 + (values[code] // 10**(digits - 1 - i)) % 10
+
+    return chars.view("S%d" % width).ravel().tolist()
+
+class TimeFormatter:
+    """Converts numbers of seconds into time strings with a fixed
+    format, subseconds setting, and t0.
+
+    Arguments:
+       format (string): time format (see `time documentation
+       <http://docs.python.org/library/time.html#time.strftime>`_)
+
+       subseconds (bool): if True, append ".xxx" at the end of
+       the string as fractions of a second
+
+       t0 (number or time-string): the time from which to start
+       counting; zero is equivalent to Jan 1, 1970
+
+       cachesize (int): maximum number of formatted strings to
+       remember
+
+    Behavior:
+       Call the TimeFormatter with a number or a list of numbers, as
+       in `totimestring`.
+
+       `t0` is parsed once, when the TimeFormatter is constructed.
+       Strings for single numbers are remembered, so that redrawing
+       the same tick-marks does not call `time.strftime` again; the
+       cache is emptied when it reaches `cachesize`.
+
+       Lists of numbers are formatted all at once by array arithmetic
+       if the format is built only from zero-padded numerical fields
+       (`%Y`, `%y`, `%m`, `%d`, `%H`, `%M`, `%S`) and literal
+       characters, such as the default "%Y-%m-%d %H:%M:%S"; otherwise,
+       they are formatted one at a time through the cache.
+    """
+
+    def __init__(self, format, subseconds=False, t0=0., cachesize=10000):
+        self.format, self.subseconds, self.cachesize = format, subseconds, cachesize
+
+        if isinstance(t0, (numbers.Number, numpy.number)):
+            self.t0 = float(t0)
+        else:
+            self.t0 = _strptime_converter(format, subseconds)(t0)
+
+        self._fixed = _fixedwidth_format(format)
+        self._cache = {}
+
+    def __repr__(self):
+        return "<TimeFormatter %s subseconds=%s t0=%g>" % (repr(self.format), self.subseconds, self.t0)
+
+    def __call__(self, timenumbers):
+        if isinstance(timenumbers, (numbers.Number, numpy.number)):
+            return self.one(timenumbers)
+        else:
+            return self.many(timenumbers)
+
+    def _format(self, timenumber):
+        if self.subseconds:
+            subsecs, secs = math.modf(timenumber + self.t0)
+            ss = str(abs(subsecs))[2:]
+            if ss == "0":
+                return time.strftime(self.format, time.gmtime(int(secs)))
+            else:
+                return "%s.%s" % (time.strftime(self.format, time.gmtime(int(secs))), ss)
+        else:
+            secs = round(timenumber + self.t0)
+            return time.strftime(self.format, time.gmtime(int(secs)))
+
+    def one(self, timenumber):
+        """Format a single number, using the cache."""
+
+        try:
+            return self._cache[timenumber]
+        except KeyError:
+            if len(self._cache) >= self.cachesize:
+                self._cache.clear()
+            output = self._cache[timenumber] = self._format(timenumber)
+            return output
+
+    def many(self, timenumbers):
+        """Format a list of numbers, returning a list of strings."""
+
+        output = None
+        if self._fixed is not None and len(timenumbers) > 0:
+            values = numpy.asarray(timenumbers, dtype=numpy.float) + self.t0
+            if values.ndim == 1 and numpy.all(numpy.isfinite(values)):
+                if self.subseconds:
+                    subsecs, secs = numpy.modf(values)
+                else:
+                    # round half away from zero, like the built-in round
+                    secs = numpy.copysign(numpy.floor(numpy.abs(values) + 0.5), values)
+                output = _totimestring_fixedwidth(secs.astype(numpy.int64), self._fixed)
+
+                if output is not None and self.subseconds:
+                    for i, subsec in enumerate(subsecs.tolist()):
+                        ss = str(abs(subsec))[2:]
+                        if ss != "0":
+                            output[i] = "%s.%s" % (output[i], ss)
+
+        if output is None:
+            output = [self.one(timenumber) for timenumber in timenumbers]
+
+        return output
+
+_timeformatters = {}
+
+def timeformatter(format, subseconds=False, t0=0.):
+    """Return a shared `TimeFormatter` for this `format`,
+    `subseconds`, and `t0`, creating it if necessary."""
+
+    key = (format, subseconds, t0)
+    try:
+        return _timeformatters[key]
+    except KeyError:
+        if len(_timeformatters) >= 100:
+            _timeformatters.clear()
+        output = _timeformatters[key] = TimeFormatter(format, subseconds, t0)
+        return output
+
 def totimestring(timenumbers, format, subseconds=False, t0=0.):
     """Convert a number of seconds or a list of numbers into time string(s).
 
@@ -495,48 +918,21 @@ def totimestring(timenumbers, format, subseconds=False, t0=0.):
 
        Subseconds are _always_ at the end of the string, regardless of
        where the seconds appear in the format (if at all).
+
+       Conversions are performed by a `TimeFormatter`, which is
+       created once for each (`format`, `subseconds`, `t0`) and
+       reused, so `t0` is only parsed once and recently formatted
+       numbers are looked up instead of being formatted again.
     """
 
-    if isinstance(t0, (numbers.Number, numpy.number)):
-        t0 = float(t0)
-    else:
-        if subseconds:
-            pytimestring, subsecs = t0.split(".")
-            subsecs = float("0." + subsecs)
-        else:
-            pytimestring, subsecs = t0, 0.
-        tmp = time.strptime(pytimestring, format)
-        tmp = [tmp.tm_year, tmp.tm_mon, tmp.tm_mday, tmp.tm_hour, tmp.tm_min, tmp.tm_sec, tmp.tm_wday, tmp.tm_yday, tmp.tm_isdst]
-        if format.find("%y") == -1 and format.find("%Y") == -1:
-            tmp[0] = 1970
-        tzoffset = 0
-        if format.find("%Z") == -1:
-            # if time.daylight:
-            #     tzoffset = time.altzone
-            # else:
-                tzoffset = time.timezone
-        t0 = time.mktime(tuple(tmp)) - tzoffset + subsecs
+    return timeformatter(format, subseconds, t0)(timenumbers)
 
-    single_value = False
-    if isinstance(timenumbers, (numbers.Number, numpy.number)):
-        single_value = True
-        timenumbers = [timenumbers]
-        
-    output = []
-    for timenumber in timenumbers:
-        if subseconds:
-            subsecs, secs = math.modf(timenumber + t0)
-            ss = str(abs(subsecs))[2:]
-            if ss == "0":
-                output.append(time.strftime(format, time.gmtime(int(secs))))
-            else:
-                output.append("%s.%s" % (time.strftime(format, time.gmtime(int(secs))), ss))
-        else:
-            secs = round(timenumber + t0)
-            output.append(time.strftime(format, time.gmtime(int(secs))))
-
-    if single_value: return output[0]
-    else: return output
+def _calendar_granule(step):
+    # a calendar granularity, ("m", months, 0.) or ("y", years, 0.), if step is a whole number of MONTHs or YEARs, else None
+    for kind, unit in ("y", YEAR), ("m", MONTH):
+        if step > 0 and step % unit == 0.:
+            return kind, int(step // unit), 0.
+    return None
 
 def timeticks(major, minor, format="%Y-%m-%d %H:%M:%S", subseconds=False, t0=0., start=None):
     """Set x tick-marks to temporally meaningful values.
@@ -561,22 +957,199 @@ def timeticks(major, minor, format="%Y-%m-%d %H:%M:%S", subseconds=False, t0=0.,
        of the tick-marks (use `t0` if `None`)
 
     Behavior:
-       A "month" is taken to be exactly 31 days and a "year" is
-       taken to be exactly 365 days.  Week markers will only line
-       up with month markers at `start`.
+       If `start` is `None` and an interval is a whole number of
+       MONTHs or YEARs, its ticks are placed on the first day of
+       real calendar months or years (UTC), as in `calendarticks`.
+
+       Otherwise, a "month" is taken to be exactly 31 days and a
+       "year" is taken to be exactly 365 days.  Week markers will
+       only line up with month markers at `start`.
     """
 
-    if start is None: start = t0
+    formatter = timeformatter(format, subseconds, t0)
+
+    if start is None:
+        majorgranule, minorgranule = _calendar_granule(major), _calendar_granule(minor)
+        start = t0
+    else:
+        majorgranule, minorgranule = None, None
 
     if isinstance(start, basestring): start = fromtimestring(start, format, subseconds, t0)
 
     def timeticks(low, high):
-        newstart = math.ceil((low - start)/major) * major + start
-        return dict(map(lambda x: (x, totimestring(x, format, subseconds, t0)), numpy.arange(newstart, high, major, dtype=numpy.float)))
+        if majorgranule is not None:
+            values = _calendar_ticks(majorgranule, low + formatter.t0, high + formatter.t0) - formatter.t0
+        else:
+            newstart = math.ceil((low - start)/major) * major + start
+            values = numpy.arange(newstart, high, major, dtype=numpy.float)
+        return dict(zip(values, formatter(values)))
+
+    def timeminiticks(low, high):
+        if minorgranule is not None:
+            values = _calendar_ticks(minorgranule, low + formatter.t0, high + formatter.t0) - formatter.t0
+        else:
+            newstart = math.ceil((low - start)/minor) * minor + start
+            values = numpy.arange(newstart, high, minor, dtype=numpy.float)
+        return dict(map(lambda x: (x, None), values))
+
+    return timeticks, timeminiticks
+
+# calendar granularities for calendarticks, from finest to coarsest: (major, minor, automatic label format)
+# each granularity is (kind, size, phase): "s" for every `size` seconds after `phase`, "m" for months, "y" for years
+_calendar_granularities = [
+    (("s", 1, 0.), None, "%Y-%m-%d %H:%M:%S"),
+    (("s", 2, 0.), ("s", 1, 0.), "%Y-%m-%d %H:%M:%S"),
+    (("s", 5, 0.), ("s", 1, 0.), "%Y-%m-%d %H:%M:%S"),
+    (("s", 10, 0.), ("s", 2, 0.), "%Y-%m-%d %H:%M:%S"),
+    (("s", 15, 0.), ("s", 5, 0.), "%Y-%m-%d %H:%M:%S"),
+    (("s", 30, 0.), ("s", 10, 0.), "%Y-%m-%d %H:%M:%S"),
+    (("s", 60, 0.), ("s", 15, 0.), "%Y-%m-%d %H:%M"),
+    (("s", 120, 0.), ("s", 30, 0.), "%Y-%m-%d %H:%M"),
+    (("s", 300, 0.), ("s", 60, 0.), "%Y-%m-%d %H:%M"),
+    (("s", 600, 0.), ("s", 120, 0.), "%Y-%m-%d %H:%M"),
+    (("s", 900, 0.), ("s", 300, 0.), "%Y-%m-%d %H:%M"),
+    (("s", 1800, 0.), ("s", 600, 0.), "%Y-%m-%d %H:%M"),
+    (("s", 3600, 0.), ("s", 900, 0.), "%Y-%m-%d %H:%M"),
+    (("s", 7200, 0.), ("s", 1800, 0.), "%Y-%m-%d %H:%M"),
+    (("s", 10800, 0.), ("s", 3600, 0.), "%Y-%m-%d %H:%M"),
+    (("s", 21600, 0.), ("s", 3600, 0.), "%Y-%m-%d %H:%M"),
+    (("s", 43200, 0.), ("s", 10800, 0.), "%Y-%m-%d %H:%M"),
+    (("s", 86400, 0.), ("s", 21600, 0.), "%Y-%m-%d"),
+    (("s", 172800, 0.), ("s", 86400, 0.), "%Y-%m-%d"),
+    (("s", 604800, 345600.), ("s", 86400, 0.), "%Y-%m-%d"),      # weeks start on Monday, Jan 5, 1970
+    (("m", 1, 0.), ("s", 604800, 345600.), "%Y-%m"),
+    (("m", 2, 0.), ("m", 1, 0.), "%Y-%m"),
+    (("m", 3, 0.), ("m", 1, 0.), "%Y-%m"),
+    (("m", 6, 0.), ("m", 1, 0.), "%Y-%m"),
+    (("y", 1, 0.), ("m", 3, 0.), "%Y"),
+    (("y", 2, 0.), ("y", 1, 0.), "%Y"),
+    (("y", 5, 0.), ("y", 1, 0.), "%Y"),
+    ]
+
+def _calendar_granularity(span, N):
+    # the finest granularity with no more than N major ticks in span seconds
+    for major, minor, format in _calendar_granularities:
+        kind, size, phase = major
+        if kind == "s": length = size
+        elif kind == "m": length = size * 30.436875*DAY
+        else: length = size * 365.2425*DAY
+        if span <= N * length:
+            return major, minor, format
+
+    size = 10
+    while size < 1e10:
+        for multiple, subdivisions in (1, 5), (2, 4), (5, 5):
+            if span <= N * multiple*size * 365.2425*DAY:
+                return ("y", multiple*size, 0.), ("y", multiple*size // subdivisions, 0.), "%Y"
+        size *= 10
+    return ("y", size, 0.), ("y", size // 5, 0.), "%Y"
+
+def _calendar_ticks_compute(granule, low, high):
+    kind, size, phase = granule
+    if kind == "s":
+        first = math.ceil((low - phase)/size)*size + phase
+        return numpy.arange(first, high + 0.5*size, size, dtype=numpy.float)
+
+    years, months, days = _civil_from_days(numpy.array([math.floor(low/DAY), math.floor(high/DAY)], dtype=numpy.int64))
+    if kind == "m":
+        index = numpy.arange(years[0]*12 + months[0] - 1, years[1]*12 + months[1], dtype=numpy.int64)
+        index = index[index % size == 0]
+        output = _days_from_civil(index // 12, index % 12 + 1, 1) * DAY
+    else:
+        year = numpy.arange(years[0], years[1] + 1, dtype=numpy.int64)
+        year = year[year % size == 0]
+        output = _days_from_civil(year, numpy.ones(len(year), dtype=numpy.int64), 1) * DAY
+    return output.astype(numpy.float)
+
+# tick tables of the most recently used calendar granularities: granule -> (low, high, ticks); the last item is the newest
+_calendar_tables = collections.OrderedDict()
+_calendar_tablessize = 64
+
+def _calendar_ticks(granule, low, high):
+    """Return the ticks of one calendar granularity between low and high (seconds since Jan 1, 1970, UTC).
+
+    Ticks are computed for a wider interval than requested and kept, so
+    that panning and zooming within it only needs a lookup.
+    """
+
+    if not (-1e13 < low <= high < 1e13):
+        return numpy.array([], dtype=numpy.float)
+
+    try:
+        tablelow, tablehigh, table = _calendar_tables.pop(granule)
+    except KeyError:
+        tablelow, tablehigh, table = None, None, None
+
+    if table is None or low < tablelow or high > tablehigh:
+        span = high - low
+        if table is not None and (min(low, tablelow) > tablelow - 10.*span and max(high, tablehigh) < tablehigh + 10.*span and max(high, tablehigh) - min(low, tablelow) < 100.*span):
+            # extend the table that is already there (but not without limit, when panning far)
+            tablelow, tablehigh = min(low - span, tablelow), max(high + span, tablehigh)
+        else:
+            tablelow, tablehigh = low - span, high + span
+        table = _calendar_ticks_compute(granule, tablelow, tablehigh)
+        table = table[numpy.logical_and(table >= tablelow, table <= tablehigh)]
+        if len(_calendar_tables) >= _calendar_tablessize:
+            _calendar_tables.popitem(last=False)
+    _calendar_tables[granule] = tablelow, tablehigh, table
+
+    return table[numpy.searchsorted(table, low, "left"):numpy.searchsorted(table, high, "right")]
+
+def calendarticks(N=6, format=None, subseconds=False, t0=0.):
+    """Set x tick-marks on calendar boundaries, choosing the
+    granularity (seconds to years) from the range being drawn.
+
+    Arguments:
+       N (int): maximum number of major ticks (ticks with labels)
+
+       format (string or `None`): time format (see `time documentation
+       <http://docs.python.org/library/time.html#time.strftime>`_);
+       if `None`, use a format that suits the granularity, such as
+       "%Y-%m-%d %H:%M" for hours or "%Y" for years
+
+       subseconds (bool): if True, append ".xxx" at the end of
+       the labels as fractions of a second
+
+       t0 (number or time-string): the time from which to start
+       counting; zero is equivalent to Jan 1, 1970
+
+    Behavior:
+       Returns a (timeticks, timeminiticks) pair, like `timeticks`,
+       to be passed as `xticks`.
+
+       The major granularity is the finest of 1, 2, 5, 10, 15, 30
+       seconds, 1, 2, 5, 10, 15, 30 minutes, 1, 2, 3, 6, 12 hours, 1,
+       2 days, 1 week, 1, 2, 3, 6 months, and 1, 2, 5, 10, 20, 50,
+       ... years that has no more than `N` ticks in the range.  Days
+       start at midnight, weeks start on Monday, months and years
+       start on the first day of the real calendar month or year (all
+       in UTC).
+
+       Tick positions of each granularity are computed for a range
+       wider than the one drawn and reused, so zooming or panning
+       within it does not compute them again.
+    """
+
+    formatters = {}
+
+    def granularity(low, high):
+        major, minor, autoformat = _calendar_granularity(high - low, N)
+        if format is None: f = autoformat
+        else: f = format
+        if f not in formatters:
+            formatters[f] = timeformatter(f, subseconds, t0)
+        return major, minor, formatters[f]
+
+    def timeticks(low, high):
+        major, minor, formatter = granularity(low, high)
+        values = _calendar_ticks(major, low + formatter.t0, high + formatter.t0) - formatter.t0
+        return dict(zip(values, formatter(values)))
 
     def timeminiticks(low, high):
-        newstart = math.ceil((low - start)/minor) * minor + start
-        return dict(map(lambda x: (x, None), numpy.arange(newstart, high, minor, dtype=numpy.float)))
+        major, minor, formatter = granularity(low, high)
+        if minor is None: return {}
+        values = _calendar_ticks(minor, low + formatter.t0, high + formatter.t0) - formatter.t0
+        return dict(map(lambda x: (x, None), values))
 
     return timeticks, timeminiticks
 
@@ -586,4 +1159,4 @@ HOUR = 60.*60.
 DAY = 60.*60.*24.
 WEEK = 60.*60.*24.*7.
 MONTH = 60.*60.*24.*31.
-YEAR = 60.*60.*24.*356.
+YEAR = 60.*60.*24.*365.